@@ -0,0 +1,105 @@
+\c possum
+
+-- Band-partitioned state tables
+-- possum.observation_state, possum.tile_state and possum.partial_tile_1d_pipeline are partitioned by
+-- band (LIST), and the existing per-band tables are attached as their partitions, so the old table
+-- names keep working for reads and writes (no data is copied). Queries on the parent tables with a
+-- band condition only touch that band's partition; queries without one cover all bands.
+--
+-- Apply db/state_counters.sql first: the counting triggers on the parent tables label rows by band.
+--
+-- A new band is a new partition, e.g.
+--   CREATE TABLE possum.tile_state_band3 PARTITION OF possum.tile_state FOR VALUES IN (3);
+--   ALTER TABLE possum.tile_state_band3 ALTER COLUMN band SET DEFAULT 3;
+-- followed by its state_change trigger (db/state_change_feed.sql) and
+--   SELECT possum.track_states('tile_state_band3', 'possum.tile_state_band3', 'tile', ARRAY[...]);
+BEGIN;
+
+-- Partition key on the per-band tables. The default fills existing rows without a rewrite, and
+-- the CHECK constraints let ATTACH PARTITION skip its validation scan.
+ALTER TABLE possum.observation_state_band1 ADD COLUMN band smallint NOT NULL DEFAULT 1
+    CONSTRAINT observation_state_band1_band_check CHECK (band = 1);
+ALTER TABLE possum.observation_state_band2 ADD COLUMN band smallint NOT NULL DEFAULT 2
+    CONSTRAINT observation_state_band2_band_check CHECK (band = 2);
+ALTER TABLE possum.tile_state_band1 ADD COLUMN band smallint NOT NULL DEFAULT 1
+    CONSTRAINT tile_state_band1_band_check CHECK (band = 1);
+ALTER TABLE possum.tile_state_band2 ADD COLUMN band smallint NOT NULL DEFAULT 2
+    CONSTRAINT tile_state_band2_band_check CHECK (band = 2);
+ALTER TABLE possum.partial_tile_1d_pipeline_band1 ADD COLUMN band smallint NOT NULL DEFAULT 1
+    CONSTRAINT partial_tile_1d_pipeline_band1_band_check CHECK (band = 1);
+ALTER TABLE possum.partial_tile_1d_pipeline_band2 ADD COLUMN band smallint NOT NULL DEFAULT 2
+    CONSTRAINT partial_tile_1d_pipeline_band2_band_check CHECK (band = 2);
+
+-- Partitions must have the same column types: tile_state_band2."3d_pipeline" is text, band 1 has a timestamp.
+-- Fails (and changes nothing) if any band 2 value is not a valid timestamp.
+DO $$
+DECLARE
+    target text;
+    value text;
+    invalid text;
+BEGIN
+    SELECT format_type(atttypid, atttypmod) INTO target FROM pg_attribute
+    WHERE attrelid = 'possum.tile_state_band1'::regclass AND attname = '3d_pipeline';
+    IF target = (SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+                 WHERE attrelid = 'possum.tile_state_band2'::regclass AND attname = '3d_pipeline') THEN
+        RETURN;
+    END IF;
+    FOR value IN SELECT DISTINCT "3d_pipeline" FROM possum.tile_state_band2 WHERE trim("3d_pipeline") <> '' LOOP
+        BEGIN
+            EXECUTE format('SELECT %L::%s', value, target);
+        EXCEPTION WHEN others THEN
+            invalid := concat_ws(', ', invalid, quote_literal(value));
+        END;
+    END LOOP;
+    IF invalid IS NOT NULL THEN
+        RAISE EXCEPTION 'tile_state_band2."3d_pipeline" values that are not timestamps: %', invalid;
+    END IF;
+    EXECUTE format('ALTER TABLE possum.tile_state_band2 ALTER COLUMN "3d_pipeline" TYPE %1$s '
+                   'USING nullif(trim("3d_pipeline"), %2$L)::%1$s', target, '');
+END $$;
+
+-- Parent tables. Unique constraints on a partitioned table must include the partition key;
+-- the key column comes first so lookups across bands can use the index.
+CREATE TABLE possum.observation_state (LIKE possum.observation_state_band1) PARTITION BY LIST (band);
+ALTER TABLE possum.observation_state ATTACH PARTITION possum.observation_state_band1 FOR VALUES IN (1);
+ALTER TABLE possum.observation_state ATTACH PARTITION possum.observation_state_band2 FOR VALUES IN (2);
+ALTER TABLE possum.observation_state ADD CONSTRAINT observation_state_name_band_key UNIQUE (name, band);
+
+CREATE TABLE possum.tile_state (LIKE possum.tile_state_band1) PARTITION BY LIST (band);
+ALTER TABLE possum.tile_state ATTACH PARTITION possum.tile_state_band1 FOR VALUES IN (1);
+ALTER TABLE possum.tile_state ATTACH PARTITION possum.tile_state_band2 FOR VALUES IN (2);
+ALTER TABLE possum.tile_state ADD CONSTRAINT tile_state_tile_band_key UNIQUE (tile, band);
+
+CREATE TABLE possum.partial_tile_1d_pipeline (LIKE possum.partial_tile_1d_pipeline_band1) PARTITION BY LIST (band);
+ALTER TABLE possum.partial_tile_1d_pipeline ATTACH PARTITION possum.partial_tile_1d_pipeline_band1 FOR VALUES IN (1);
+ALTER TABLE possum.partial_tile_1d_pipeline ATTACH PARTITION possum.partial_tile_1d_pipeline_band2 FOR VALUES IN (2);
+ALTER TABLE possum.partial_tile_1d_pipeline ADD CONSTRAINT partial_tile_1d_pipeline_id_band_key UNIQUE (id, band);
+
+-- One id sequence for all bands, so new regions have ids that are unique across bands
+CREATE SEQUENCE possum.partial_tile_1d_pipeline_id_seq AS bigint OWNED BY possum.partial_tile_1d_pipeline.id;
+SELECT setval('possum.partial_tile_1d_pipeline_id_seq', COALESCE(max(id), 0) + 1, false) FROM possum.partial_tile_1d_pipeline;
+ALTER TABLE possum.partial_tile_1d_pipeline ALTER COLUMN id SET DEFAULT nextval('possum.partial_tile_1d_pipeline_id_seq');
+ALTER TABLE possum.partial_tile_1d_pipeline_band1 ALTER COLUMN id SET DEFAULT nextval('possum.partial_tile_1d_pipeline_id_seq');
+ALTER TABLE possum.partial_tile_1d_pipeline_band2 ALTER COLUMN id SET DEFAULT nextval('possum.partial_tile_1d_pipeline_id_seq');
+
+-- Cross-band lookups (created on every partition; matching existing indexes are attached instead)
+CREATE INDEX observation_state_cube_state_idx ON possum.observation_state (cube_state);
+CREATE INDEX observation_state_mfs_state_idx ON possum.observation_state (mfs_state);
+CREATE INDEX tile_state_cube_state_idx ON possum.tile_state (cube_state);
+CREATE INDEX tile_state_mfs_state_idx ON possum.tile_state (mfs_state);
+CREATE INDEX tile_state_3d_pipeline_val_idx ON possum.tile_state ("3d_pipeline_val");
+CREATE INDEX partial_tile_1d_pipeline_observation_idx ON possum.partial_tile_1d_pipeline (observation);
+CREATE INDEX partial_tile_1d_pipeline_1d_pipeline_idx ON possum.partial_tile_1d_pipeline ("1d_pipeline");
+
+-- Row level triggers (state change feed) on the partitions also fire for writes through the parent
+-- tables. Statement level triggers do not, so the parent tables count states themselves, labelled
+-- with the partition name of each row.
+SELECT possum.track_states('observation_state_band%s', 'possum.observation_state', 'name', ARRAY['1d_pipeline_validation', 'mfs_state', 'cube_state']);
+SELECT possum.track_states('tile_state_band%s', 'possum.tile_state', 'tile', ARRAY['3d_pipeline_val', 'mfs_state', 'cube_state']);
+SELECT possum.track_states('partial_tile_1d_pipeline_band%s', 'possum.partial_tile_1d_pipeline', 'id', ARRAY['1d_pipeline']);
+
+COMMIT;
+
+ANALYZE possum.observation_state;
+ANALYZE possum.tile_state;
+ANALYZE possum.partial_tile_1d_pipeline;
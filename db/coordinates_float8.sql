@@ -0,0 +1,65 @@
+\c possum
+
+-- Convert the tile and observation coordinates (ra_deg, dec_deg, gl, gb) from NUMERIC to double precision.
+-- Run once, in a maintenance window: the tables are rewritten and locked for the duration.
+-- The converted values are checked against the original values before the transaction is committed.
+BEGIN;
+
+CREATE TEMPORARY TABLE tile_coordinates ON COMMIT DROP AS
+    SELECT tile, ra_deg, dec_deg, gl, gb FROM possum.tile;
+CREATE TEMPORARY TABLE observation_coordinates ON COMMIT DROP AS
+    SELECT name, ra_deg, dec_deg, gl, gb FROM possum.observation;
+
+-- Position indexes (db/spatial_index.sql) are recreated on the new column type below
+DROP INDEX IF EXISTS possum.tile_position_idx;
+DROP INDEX IF EXISTS possum.observation_position_idx;
+
+ALTER TABLE possum.tile
+    ALTER COLUMN ra_deg TYPE double precision USING ra_deg::double precision,
+    ALTER COLUMN dec_deg TYPE double precision USING dec_deg::double precision,
+    ALTER COLUMN gl TYPE double precision USING gl::double precision,
+    ALTER COLUMN gb TYPE double precision USING gb::double precision;
+
+ALTER TABLE possum.observation
+    ALTER COLUMN ra_deg TYPE double precision USING ra_deg::double precision,
+    ALTER COLUMN dec_deg TYPE double precision USING dec_deg::double precision,
+    ALTER COLUMN gl TYPE double precision USING gl::double precision,
+    ALTER COLUMN gb TYPE double precision USING gb::double precision;
+
+DO $$
+DECLARE
+    tile_mismatches bigint;
+    observation_mismatches bigint;
+BEGIN
+    SELECT count(*) INTO tile_mismatches
+    FROM tile_coordinates b FULL JOIN possum.tile t ON t.tile = b.tile
+    WHERE t.tile IS NULL OR b.tile IS NULL
+       OR (t.ra_deg IS NULL) <> (b.ra_deg IS NULL) OR abs(t.ra_deg::numeric - b.ra_deg) > 1e-9
+       OR (t.dec_deg IS NULL) <> (b.dec_deg IS NULL) OR abs(t.dec_deg::numeric - b.dec_deg) > 1e-9
+       OR (t.gl IS NULL) <> (b.gl IS NULL) OR abs(t.gl::numeric - b.gl) > 1e-9
+       OR (t.gb IS NULL) <> (b.gb IS NULL) OR abs(t.gb::numeric - b.gb) > 1e-9;
+
+    SELECT count(*) INTO observation_mismatches
+    FROM observation_coordinates b FULL JOIN possum.observation o ON o.name = b.name
+    WHERE o.name IS NULL OR b.name IS NULL
+       OR (o.ra_deg IS NULL) <> (b.ra_deg IS NULL) OR abs(o.ra_deg::numeric - b.ra_deg) > 1e-9
+       OR (o.dec_deg IS NULL) <> (b.dec_deg IS NULL) OR abs(o.dec_deg::numeric - b.dec_deg) > 1e-9
+       OR (o.gl IS NULL) <> (b.gl IS NULL) OR abs(o.gl::numeric - b.gl) > 1e-9
+       OR (o.gb IS NULL) <> (b.gb IS NULL) OR abs(o.gb::numeric - b.gb) > 1e-9;
+
+    IF tile_mismatches > 0 OR observation_mismatches > 0 THEN
+        RAISE EXCEPTION 'Coordinate conversion check failed: % tile and % observation rows differ',
+            tile_mismatches, observation_mismatches;
+    END IF;
+    RAISE NOTICE 'Coordinate conversion checked: all tile and observation rows match';
+
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_sphere') THEN
+        CREATE INDEX tile_position_idx ON possum.tile USING gist (spoint(radians(ra_deg), radians(dec_deg)));
+        CREATE INDEX observation_position_idx ON possum.observation USING gist (spoint(radians(ra_deg), radians(dec_deg)));
+    END IF;
+END $$;
+
+COMMIT;
+
+ANALYZE possum.tile;
+ANALYZE possum.observation;
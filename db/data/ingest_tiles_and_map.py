@@ -4,49 +4,213 @@ import os
 import sys
 import glob
 import csv
+import time
 from argparse import ArgumentParser
 from configparser import ConfigParser
 import asyncio
 import asyncpg
 
+from tile_band_count import refresh_tile_band_count
 
-async def upsert_file(db_pool, file):
+
+def observation_name(file):
+    """Observation name from the mapping filename (e.g. EMU-FULL_2317+04B_1.50d.csv -> EMU_2317+04B)
+
+    """
+    return os.path.basename(file).replace('-FULL', '').strip('.csv').rsplit('_', 1)[0]
+
+
+def read_file(file):
+    """Parse a mapping CSV file into a list of (tile_id, ra, dec) tuples.
+
+    """
+    rows = []
+    with open(file) as csvfile:
+        lines = csv.reader(csvfile, delimiter=',')
+        next(lines)
+        for row in lines:
+            tile_id = int(row[0])
+            ra = float(row[3])
+            dec = float(row[4])
+            rows.append((tile_id, ra, dec))
+    return rows
+
+
+def read_files(files):
+    """Parse all mapping files up front.
+    - Tiles are deduplicated by tile id (first occurrence wins)
+    - Tile map entries are deduplicated on (observation, tile)
+
+    """
+    tiles = {}
+    tile_map = set()
+    for f in files:
+        obs_name = observation_name(f)
+        for tile_id, ra, dec in read_file(f):
+            tiles.setdefault(tile_id, (tile_id, ra, dec))
+            tile_map.add((obs_name, tile_id))
+    return sorted(tiles.values()), sorted(tile_map)
+
+
+class TileWriter:
+    """Single writer stage for new tiles.
+    Workers submit the tiles of a file and wait until they are committed. Pending submissions
+    are merged, deduplicated and inserted in tile order by one connection, so concurrent files
+    never race each other on the tile primary key.
+
+    """
+    def __init__(self, db_pool, batch_size):
+        self.db_pool = db_pool
+        self.batch_size = batch_size
+        self.queue = asyncio.Queue()
+        self.known = set()
+        self.inserted = 0
+
+    async def submit(self, rows):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((rows, future))
+        await future
+
+    async def run(self):
+        async with self.db_pool.acquire() as conn:
+            while True:
+                requests = [await self.queue.get()]
+                while not self.queue.empty():
+                    requests.append(self.queue.get_nowait())
+                try:
+                    new_tiles = {}
+                    for rows, _ in requests:
+                        for tile_id, ra, dec in rows:
+                            if tile_id not in self.known:
+                                new_tiles.setdefault(tile_id, (tile_id, ra, dec))
+                    new_tiles = sorted(new_tiles.values())
+                    for i in range(0, len(new_tiles), self.batch_size):
+                        async with conn.transaction():
+                            await conn.executemany(
+                                'INSERT INTO possum.tile (tile, ra_deg, dec_deg) VALUES ($1, $2, $3) '
+                                'ON CONFLICT (tile) DO NOTHING',
+                                new_tiles[i:i + self.batch_size]
+                            )
+                    self.known.update(t[0] for t in new_tiles)
+                    self.inserted += len(new_tiles)
+                    for _, future in requests:
+                        future.set_result(None)
+                except Exception as e:
+                    for _, future in requests:
+                        if not future.done():
+                            future.set_exception(e)
+                finally:
+                    for _ in requests:
+                        self.queue.task_done()
+
+
+async def upsert_file(db_pool, tile_writer, file, batch_size):
     """Insert all relevant data from the CSV files into the database.
-    - Insert new tile if required
-    - Insert entries for associated tile and field tile tables
+    - Hand new tiles to the single tile writer and wait for them to be committed
+    - Insert entries for associated tile table in transactions of batch_size rows
 
     """
+    obs_name = observation_name(file)
+    rows = read_file(file)
+    await tile_writer.submit(rows)
+    tile_map = sorted({(obs_name, tile_id) for tile_id, _, _ in rows})
+    async with db_pool.acquire() as conn:
+        for i in range(0, len(tile_map), batch_size):
+            async with conn.transaction():
+                await conn.executemany(
+                    'INSERT INTO possum.associated_tile (name, tile) VALUES ($1, $2) ON CONFLICT DO NOTHING',
+                    tile_map[i:i + batch_size]
+                )
+    return obs_name, len(tile_map)
+
+
+async def schedule(db_pool, files, workers, batch_size):
+    """Ingest files with a fixed number of workers.
+    Each worker owns one pool connection and takes the next file from a queue. New tiles are
+    written by a separate single-writer stage. Progress and per-file timing are printed as
+    files complete.
+
+    """
+    start = time.perf_counter()
+    tile_writer = TileWriter(db_pool, batch_size)
+    writer_task = asyncio.create_task(tile_writer.run())
+    file_queue = asyncio.Queue()
+    for f in files:
+        file_queue.put_nowait(f)
+    timings = []
+
+    async def worker():
+        while True:
+            try:
+                f = file_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            t0 = time.perf_counter()
+            obs_name, n_rows = await upsert_file(db_pool, tile_writer, f, batch_size)
+            dt = time.perf_counter() - t0
+            timings.append((dt, obs_name, n_rows))
+            print(f'[{len(timings)}/{len(files)}] {obs_name}: {n_rows} rows in {dt:.3f}s')
+
+    tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        # Stop the other workers (if one failed) and the tile writer before the pool is closed
+        for task in tasks + [writer_task]:
+            task.cancel()
+        await asyncio.gather(*tasks, writer_task, return_exceptions=True)
+
+    async with db_pool.acquire() as conn:
+        await refresh_tile_band_count(conn)
+
+    elapsed = time.perf_counter() - start
+    rows = sum(t[2] for t in timings)
+    print(f'Ingested {len(timings)} files ({tile_writer.inserted} new tiles, {rows} tile map entries) '
+          f'in {elapsed:.2f}s with {workers} workers ({rows / max(elapsed, 1e-9):.0f} rows/s)')
+    for dt, obs_name, n_rows in sorted(timings, reverse=True)[:5]:
+        print(f'Slowest: {obs_name} {n_rows} rows in {dt:.3f}s')
+    return
+
+
+async def bulk_upsert(db_pool, files):
+    """Ingest all files in a single transaction.
+    - Parse and deduplicate every file in memory
+    - COPY tiles and tile map entries into temporary staging tables
+    - Merge staging tables into possum.tile and possum.associated_tile with one INSERT ... ON CONFLICT each
+
+    """
+    start = time.perf_counter()
+    tiles, tile_map = read_files(files)
+    parsed = time.perf_counter()
+    print(f'Parsed {len(files)} files: {len(tiles)} tiles, {len(tile_map)} tile map entries ({parsed - start:.2f}s)')
+
     async with db_pool.acquire() as conn:
         async with conn.transaction():
-            obs_name = os.path.basename(file).replace('-FULL', '').strip('.csv').rsplit('_', 1)[0]
-            print(obs_name)
-            with open(file) as csvfile:
-                lines = csv.reader(csvfile, delimiter=',')
-                next(lines)
-                for row in lines:
-                    tile_id = int(row[0])  # SBID is the first
-                    crpix_ra = float(row[1])
-                    crpix_dec = float(row[2])
-                    ra = float(row[3])
-                    dec = float(row[4])
-                    print(tile_id, ra, dec)
-                    tile = await conn.fetchrow('SELECT * FROM possum.tile WHERE tile=$1', tile_id)
-
-                    # Create entry if does not exist
-                    if not tile:
-                        print(f'Creating new tile {tile_id}')
-                        res = await conn.execute(
-                            'INSERT INTO possum.tile (tile, ra_deg, dec_deg) VALUES ($1, $2, $3)',
-                            tile_id, ra, dec
-                        )
-
-                    # Database entry for associated tile and field tile
-                    res = await conn.execute(
-                        'INSERT INTO possum.associated_tile (name, tile) VALUES ($1, $2) ON CONFLICT DO NOTHING',
-                        obs_name, tile_id
-                    )
-                    print(res)
-            print("\n")
+            await conn.execute(
+                'CREATE TEMPORARY TABLE tile_staging (tile bigint, ra_deg double precision, dec_deg double precision) '
+                'ON COMMIT DROP'
+            )
+            await conn.execute(
+                'CREATE TEMPORARY TABLE associated_tile_staging (name text, tile bigint) ON COMMIT DROP'
+            )
+            await conn.copy_records_to_table('tile_staging', records=tiles, columns=['tile', 'ra_deg', 'dec_deg'])
+            await conn.copy_records_to_table('associated_tile_staging', records=tile_map, columns=['name', 'tile'])
+            tile_res = await conn.execute(
+                'INSERT INTO possum.tile (tile, ra_deg, dec_deg) '
+                'SELECT tile, ra_deg, dec_deg FROM tile_staging '
+                'ON CONFLICT (tile) DO NOTHING'
+            )
+            map_res = await conn.execute(
+                'INSERT INTO possum.associated_tile (name, tile) '
+                'SELECT name, tile FROM associated_tile_staging '
+                'ON CONFLICT DO NOTHING'
+            )
+            await refresh_tile_band_count(conn)
+
+    elapsed = time.perf_counter() - start
+    rows = len(tiles) + len(tile_map)
+    print(f'Tiles: {tile_res}, tile map: {map_res}')
+    print(f'Loaded {rows} rows in {elapsed:.2f}s ({rows / max(elapsed, 1e-9):.0f} rows/s)')
     return
 
 
@@ -54,7 +218,15 @@ async def main(argv):
     argparser = ArgumentParser()
     argparser.add_argument('-c', '--config', default='./config.ini', required=False)
     argparser.add_argument('-f', '--files', required=True)
+    argparser.add_argument('-b', '--bulk', action='store_true', default=False,
+                           help='Parse all files up front and load them with COPY in a single transaction')
+    argparser.add_argument('-w', '--workers', type=int, default=4,
+                           help='Number of files ingested concurrently (one pool connection each)')
+    argparser.add_argument('--batch-size', type=int, default=1000,
+                           help='Rows written per transaction')
     args = argparser.parse_args(argv)
+    assert args.workers > 0, 'Number of workers must be positive'
+    assert args.batch_size > 0, 'Batch size must be positive'
     assert os.path.exists(args.config), 'Provided config file does not exist'
     assert os.path.exists(args.files), 'File directory does not exist'
     config = ConfigParser()
@@ -68,17 +240,17 @@ async def main(argv):
         'database': database['database']
     }
 
-    # Database connection
-    db_pool = await asyncpg.create_pool(dsn=None, **dsn)
+    # Database connection (one connection per worker plus the tile writer)
+    db_pool = await asyncpg.create_pool(dsn=None, min_size=1, max_size=args.workers + 1, **dsn)
     csv_files = glob.glob(os.path.join(args.files, '*.csv'))
-    tasks = []
-    for f in csv_files:
-        task = asyncio.create_task(upsert_file(db_pool, f))
-        tasks.append(task)
-
-    # Run all tasks concurrently
-    await asyncio.gather(*tasks)
-    await db_pool.close()
+
+    try:
+        if args.bulk:
+            await bulk_upsert(db_pool, csv_files)
+        else:
+            await schedule(db_pool, csv_files, args.workers, args.batch_size)
+    finally:
+        await db_pool.close()
 
 
 if __name__ == '__main__':
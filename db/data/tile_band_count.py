@@ -0,0 +1,10 @@
+# Shared by ingest_tiles_and_map.py and update_tilemap.py (db/tile_band_count.sql)
+
+
+async def refresh_tile_band_count(conn):
+    """Update the precomputed per-tile band coverage counts (possum.tile_band_count).
+
+    """
+    await conn.execute('SELECT possum.refresh_tile_band_count()')
+    print('Refreshed tile band counts')
+    return
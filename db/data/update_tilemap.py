@@ -4,59 +4,301 @@ import os
 import sys
 import glob
 import csv
+import time
 from argparse import ArgumentParser
 from configparser import ConfigParser
 import asyncio
 import asyncpg
 
+from tile_band_count import refresh_tile_band_count
 
-async def insert_tiles(conn, filename):
-    """Insert tiles based on a .txt file (copied from the Google Sheet provided by Cameron, tab separated).
+
+SWAP_LOCK_TIMEOUT = '2s'
+SWAP_RETRIES = 10
+DEFAULT_CHUNK_SIZE = 10000
+
+
+def chunked(rows, chunk_size):
+    """Group an iterable of rows into lists of at most chunk_size rows.
+
+    """
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def stream_chunks(rows, chunk_size):
+    """Asynchronously yield chunks of rows from a generator.
+    The next chunk is parsed in a worker thread while the caller sends the current one to the
+    database, so parsing overlaps with network I/O and at most two chunks are held in memory.
+
+    """
+    loop = asyncio.get_running_loop()
+    chunks = chunked(rows, chunk_size)
+    pending = loop.run_in_executor(None, next, chunks, None)
+    while True:
+        chunk = await pending
+        if chunk is None:
+            return
+        pending = loop.run_in_executor(None, next, chunks, None)
+        yield chunk
+
+
+def read_tiles(filename):
+    """Parse a tiles .txt file (copied from the Google Sheet provided by Cameron, tab separated)
+    into (tile, ra_deg, dec_deg, gl, gb) tuples.
 
     """
     with open(filename, 'r') as tsv_file:
         lines = csv.reader(tsv_file, delimiter='\t')
         next(lines)
-        tiles_insert = []
         for idx, row in enumerate(lines):
             tile_id = int(row[0])
             ra_deg = float(row[3])
             dec_deg = float(row[4])
             gl = float(row[5])
             gb = float(row[6])
-            tiles_insert.append((tile_id, ra_deg, dec_deg, gl, gb))
-    await conn.executemany(
-        'INSERT INTO possum.tile (tile, ra_deg, dec_deg, gl, gb) VALUES ($1, $2, $3, $4, $5) ON CONFLICT DO NOTHING',
-        tiles_insert
-    )
+            yield (tile_id, ra_deg, dec_deg, gl, gb)
+
+
+async def insert_tiles(conn, filename, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Insert tiles based on a .txt file (copied from the Google Sheet provided by Cameron, tab separated).
+
+    """
+    async for tiles_insert in stream_chunks(read_tiles(filename), chunk_size):
+        await conn.executemany(
+            'INSERT INTO possum.tile (tile, ra_deg, dec_deg, gl, gb) VALUES ($1, $2, $3, $4, $5) ON CONFLICT DO NOTHING',
+            tiles_insert
+        )
     print('Inserted tiles')
     return
 
 
-async def insert_tilemap(conn, filename, prefix):
-    print(f'Insert into database for file {filename}')
+def read_tilemap(filename, prefix):
+    """Parse a tile-map .csv file (PIXEL,SB1,...,SB10) into (observation, tile) tuples.
+
+    """
     with open(filename) as csvfile:
         lines = csv.reader(csvfile, delimiter=',')
         next(lines)  # Header
-        tile_maps = []
         for idx, row in enumerate(lines):
             values = list(filter(None, row))
             tile_id = int(values[0])
             obs_ids = [f'{prefix}_{v}' for v in values[1:]]
             for o in obs_ids:
-                tile_maps.append((o, tile_id))
-    await conn.executemany('INSERT INTO possum.associated_tile (name, tile) VALUES ($1, $2)', tile_maps)
+                yield (o, tile_id)
+
+
+async def insert_tilemap(conn, filename, prefix, chunk_size=DEFAULT_CHUNK_SIZE):
+    print(f'Insert into database for file {filename}')
+    async for tile_maps in stream_chunks(read_tilemap(filename, prefix), chunk_size):
+        await conn.executemany('INSERT INTO possum.associated_tile (name, tile) VALUES ($1, $2)', tile_maps)
     print(f'Insert file {filename} complete')
     return
 
 
+async def check_swappable(conn):
+    """Objects that would be lost or broken by swapping in a new possum.associated_tile.
+    Triggers, row level security policies, dependent views and foreign keys referencing the table
+    are tied to the live table, so the swap refuses to run while any of them exist.
+
+    """
+    problems = []
+    for r in await conn.fetch(
+        "SELECT tgname FROM pg_trigger WHERE tgrelid = 'possum.associated_tile'::regclass AND NOT tgisinternal"
+    ):
+        problems.append(f"trigger {r['tgname']}")
+    for r in await conn.fetch(
+        'SELECT DISTINCT v.oid::regclass::text AS name FROM pg_depend d '
+        'JOIN pg_rewrite w ON w.oid = d.objid JOIN pg_class v ON v.oid = w.ev_class '
+        "WHERE d.classid = 'pg_rewrite'::regclass AND d.refobjid = 'possum.associated_tile'::regclass "
+        'AND v.oid <> d.refobjid'
+    ):
+        problems.append(f"dependent view {r['name']}")
+    for r in await conn.fetch(
+        'SELECT conname, conrelid::regclass::text AS name FROM pg_constraint '
+        "WHERE confrelid = 'possum.associated_tile'::regclass AND contype = 'f'"
+    ):
+        problems.append(f"foreign key {r['conname']} on {r['name']}")
+    if await conn.fetchval(
+        "SELECT relrowsecurity OR EXISTS (SELECT 1 FROM pg_policy WHERE polrelid = c.oid) FROM pg_class c "
+        "WHERE c.oid = 'possum.associated_tile'::regclass"
+    ):
+        problems.append('row level security')
+    return problems
+
+
+async def copy_privileges(conn):
+    """Copy the owner, table and column privileges and the table comment of possum.associated_tile
+    to possum.associated_tile_new (column comments are copied by CREATE TABLE ... LIKE).
+
+    """
+    grants = await conn.fetch(
+        "SELECT format('GRANT %s%s ON possum.associated_tile_new TO %s%s', a.privilege_type, "
+        "coalesce(' (' || quote_ident(col.attname) || ')', ''), "
+        "CASE WHEN a.grantee = 0 THEN 'PUBLIC' ELSE quote_ident(pg_get_userbyid(a.grantee)) END, "
+        "CASE WHEN a.is_grantable THEN ' WITH GRANT OPTION' ELSE '' END) AS statement "
+        'FROM (SELECT NULL::name AS attname, relacl AS acl FROM pg_class '
+        "      WHERE oid = 'possum.associated_tile'::regclass "
+        '      UNION ALL SELECT attname, attacl FROM pg_attribute '
+        "      WHERE attrelid = 'possum.associated_tile'::regclass AND attacl IS NOT NULL) col, "
+        'aclexplode(col.acl) a'
+    )
+    for grant in grants:
+        await conn.execute(grant['statement'])
+    statements = await conn.fetchrow(
+        "SELECT format('COMMENT ON TABLE possum.associated_tile_new IS %L', obj_description(oid, 'pg_class')) AS comment, "
+        "format('ALTER TABLE possum.associated_tile_new OWNER TO %I', pg_get_userbyid(relowner)) AS owner "
+        "FROM pg_class WHERE oid = 'possum.associated_tile'::regclass"
+    )
+    await conn.execute(statements['comment'])
+    # Last, as the new owner takes over the privileges the running user holds as the current owner
+    await conn.execute(statements['owner'])
+
+
+async def swap_tilemap(conn, tilemaps, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Load the tile map into a shadow table and swap it in.
+    - Check that the live table has no triggers, policies, dependent views or referencing foreign keys
+    - Build possum.associated_tile_new with COPY, then add keys and copy the indexes of the live table
+    - Copy the owner, privileges and comments of the live table
+    - Rename it over possum.associated_tile in a short transaction
+
+    The live table is only locked (ACCESS EXCLUSIVE) for the renames in the final transaction.
+    That transaction uses a lock timeout and is retried so it does not queue up readers behind
+    a long running query on the live table.
+
+    """
+    problems = await check_swappable(conn)
+    if problems:
+        raise RuntimeError(f"Cannot swap associated_tile ({', '.join(problems)}), use --mode reload or diff")
+
+    print('Building shadow table (associated_tile_new)')
+    await conn.execute('DROP TABLE IF EXISTS possum.associated_tile_new')
+    await conn.execute(
+        'CREATE TABLE possum.associated_tile_new '
+        '(LIKE possum.associated_tile INCLUDING DEFAULTS INCLUDING STORAGE INCLUDING COMMENTS)'
+    )
+    for filename, prefix in tilemaps:
+        print(f'Copy into shadow table for file {filename}')
+        async for tile_maps in stream_chunks(read_tilemap(filename, prefix), chunk_size):
+            await conn.copy_records_to_table(
+                'associated_tile_new', schema_name='possum', records=tile_maps, columns=['name', 'tile']
+            )
+
+    print('Indexing shadow table')
+    await conn.execute('ALTER TABLE possum.associated_tile_new ADD CONSTRAINT associated_tile_new_pkey PRIMARY KEY (id)')
+    await conn.execute(
+        'ALTER TABLE possum.associated_tile_new ADD CONSTRAINT associated_tile_new_name_tile_key UNIQUE (name, tile)'
+    )
+    # Copy the remaining (non-constraint) indexes of the live table, e.g. those from db/search_indexes.sql
+    indexes = await conn.fetch(
+        'SELECT i.relname AS name, pg_get_indexdef(i.oid) AS definition FROM pg_index x '
+        'JOIN pg_class i ON i.oid = x.indexrelid '
+        "WHERE x.indrelid = 'possum.associated_tile'::regclass "
+        'AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = x.indexrelid)'
+    )
+    for index in indexes:
+        definition = index['definition'].replace(
+            f"INDEX {index['name']} ON possum.associated_tile ",
+            f"INDEX {index['name']}_new ON possum.associated_tile_new ", 1
+        )
+        assert 'associated_tile_new ' in definition, f"Unexpected index definition {index['definition']}"
+        await conn.execute(definition)
+    await conn.execute(
+        'ALTER TABLE possum.associated_tile_new ADD CONSTRAINT associated_tile_new_name_fkey '
+        'FOREIGN KEY (name) REFERENCES possum.observation (name) NOT VALID'
+    )
+    await conn.execute(
+        'ALTER TABLE possum.associated_tile_new ADD CONSTRAINT associated_tile_new_tile_fkey '
+        'FOREIGN KEY (tile) REFERENCES possum.tile (tile) NOT VALID'
+    )
+    await conn.execute('ALTER TABLE possum.associated_tile_new VALIDATE CONSTRAINT associated_tile_new_name_fkey')
+    await conn.execute('ALTER TABLE possum.associated_tile_new VALIDATE CONSTRAINT associated_tile_new_tile_fkey')
+    await conn.execute('ANALYZE possum.associated_tile_new')
+    await copy_privileges(conn)
+
+    for attempt in range(1, SWAP_RETRIES + 1):
+        try:
+            start = time.perf_counter()
+            async with conn.transaction():
+                await conn.execute(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'")
+                await conn.execute('ALTER TABLE possum.associated_tile RENAME TO associated_tile_old')
+                await conn.execute('ALTER TABLE possum.associated_tile_new RENAME TO associated_tile')
+                await conn.execute('ALTER SEQUENCE possum.associated_tile_id_seq OWNED BY possum.associated_tile.id')
+                await conn.execute('DROP TABLE possum.associated_tile_old')
+                for name in ('pkey', 'name_tile_key', 'name_fkey', 'tile_fkey'):
+                    await conn.execute(
+                        f'ALTER TABLE possum.associated_tile RENAME CONSTRAINT associated_tile_new_{name} '
+                        f'TO associated_tile_{name}'
+                    )
+                for index in indexes:
+                    await conn.execute(f"ALTER INDEX possum.{index['name']}_new RENAME TO {index['name']}")
+            print(f'Swapped in new tile map (lock held for {(time.perf_counter() - start) * 1000:.1f}ms)')
+            return
+        except asyncpg.exceptions.LockNotAvailableError:
+            print(f'Could not acquire lock on associated_tile (attempt {attempt}/{SWAP_RETRIES}), retrying')
+            await asyncio.sleep(attempt)
+    raise RuntimeError('Could not swap in new tile map, associated_tile_new has been left in place')
+
+
+async def diff_tilemap(conn, tilemaps):
+    """Apply only the difference between the tile-map files and possum.associated_tile.
+    - Entries in the table but not in the files are deleted
+    - Entries in the files but not in the table are inserted
+
+    """
+    new_map = set()
+    for filename, prefix in tilemaps:
+        new_map.update(read_tilemap(filename, prefix))
+    rows = await conn.fetch('SELECT name, tile FROM possum.associated_tile')
+    current_map = {(r['name'], r['tile']) for r in rows}
+
+    to_delete = sorted(current_map - new_map)
+    to_insert = sorted(new_map - current_map)
+    if to_delete:
+        await conn.execute(
+            'DELETE FROM possum.associated_tile a '
+            'USING unnest($1::text[], $2::bigint[]) AS d(name, tile) '
+            'WHERE a.name = d.name AND a.tile = d.tile',
+            [r[0] for r in to_delete], [r[1] for r in to_delete]
+        )
+    if to_insert:
+        await conn.copy_records_to_table(
+            'associated_tile', schema_name='possum', records=to_insert, columns=['name', 'tile']
+        )
+
+    print(f'Tile map entries: {len(current_map)} current, {len(new_map)} in files, '
+          f'{len(current_map & new_map)} unchanged')
+    print(f'Deleted {len(to_delete)}, inserted {len(to_insert)}')
+    changed = {}
+    for name, _ in to_delete:
+        changed.setdefault(name, [0, 0])[0] += 1
+    for name, _ in to_insert:
+        changed.setdefault(name, [0, 0])[1] += 1
+    for name, (deleted, inserted) in sorted(changed.items()):
+        print(f'  {name}: -{deleted} +{inserted}')
+    return
+
+
 async def main(argv):
     argparser = ArgumentParser()
     argparser.add_argument('-c', '--config', default='./config.ini', required=False)
     argparser.add_argument('-e', '--emu', help='EMU Tile-map .csv file', required=True)
     argparser.add_argument('-w', '--wallaby', help='WALLABY Tile-map .csv file', required=True)
     argparser.add_argument('-t', '--tiles', help='Tiles .tsv file', required=True)
+    argparser.add_argument('-m', '--mode', choices=['reload', 'swap', 'diff'], default='reload',
+                           help='reload: truncate and re-insert in one transaction, '
+                                'swap: load a shadow table and rename it over associated_tile, '
+                                'diff: only delete and insert the entries that changed')
+    argparser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                           help='Rows sent to the database per chunk while the files are parsed')
     args = argparser.parse_args(argv)
+    assert args.chunk_size > 0, 'Chunk size must be positive'
     assert os.path.exists(args.config), 'Provided config file does not exist'
     assert os.path.exists(args.emu), 'Provided EMU tile-map file does not exist'
     assert os.path.exists(args.wallaby), 'Provided WALLABY tile-map file does not exist'
@@ -75,6 +317,27 @@ async def main(argv):
 
     # Database connection
     db_pool = await asyncpg.create_pool(dsn=None, **dsn)
+    if args.mode == 'swap':
+        async with db_pool.acquire() as conn:
+            # ingest all tiles (skip if exists)
+            await insert_tiles(conn, args.tiles, args.chunk_size)
+            await swap_tilemap(conn, [(args.emu, 'EMU'), (args.wallaby, 'WALLABY')], args.chunk_size)
+            await refresh_tile_band_count(conn)
+            print('Complete')
+        await db_pool.close()
+        return
+
+    if args.mode == 'diff':
+        async with db_pool.acquire() as conn:
+            async with conn.transaction():
+                # ingest all tiles (skip if exists)
+                await insert_tiles(conn, args.tiles, args.chunk_size)
+                await diff_tilemap(conn, [(args.emu, 'EMU'), (args.wallaby, 'WALLABY')])
+                await refresh_tile_band_count(conn)
+                print('Complete')
+        await db_pool.close()
+        return
+
     async with db_pool.acquire() as conn:
         async with conn.transaction():
             print('Clearing tables (associated_tile)')
@@ -84,11 +347,12 @@ async def main(argv):
             print('Tables cleared, sequences reset')
 
             # ingest all tiles (skip if exists)
-            await insert_tiles(conn, args.tiles)
+            await insert_tiles(conn, args.tiles, args.chunk_size)
 
             # ingest for each table
-            await insert_tilemap(conn, args.emu, prefix='EMU')
-            await insert_tilemap(conn, args.wallaby, prefix='WALLABY')
+            await insert_tilemap(conn, args.emu, prefix='EMU', chunk_size=args.chunk_size)
+            await insert_tilemap(conn, args.wallaby, prefix='WALLABY', chunk_size=args.chunk_size)
+            await refresh_tile_band_count(conn)
             print('Complete')
 
     await db_pool.close()
@@ -0,0 +1,57 @@
+\c possum
+
+-- Indexes for the admin portal search (possum/survey/search.py)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Equality lookups for numeric and SBID search terms
+CREATE INDEX IF NOT EXISTS observation_ra_deg_idx ON possum.observation (ra_deg);
+CREATE INDEX IF NOT EXISTS observation_dec_deg_idx ON possum.observation (dec_deg);
+CREATE INDEX IF NOT EXISTS observation_band_idx ON possum.observation (band);
+CREATE INDEX IF NOT EXISTS observation_sbid_idx ON possum.observation (sbid);
+CREATE INDEX IF NOT EXISTS tile_ra_deg_idx ON possum.tile (ra_deg);
+CREATE INDEX IF NOT EXISTS tile_dec_deg_idx ON possum.tile (dec_deg);
+CREATE INDEX IF NOT EXISTS associated_tile_tile_idx ON possum.associated_tile (tile);
+CREATE INDEX IF NOT EXISTS associated_tile_name_idx ON possum.associated_tile (name);
+CREATE INDEX IF NOT EXISTS partial_tile_1d_pipeline_band1_observation_idx ON possum.partial_tile_1d_pipeline_band1 (observation);
+CREATE INDEX IF NOT EXISTS partial_tile_1d_pipeline_band1_tile1_idx ON possum.partial_tile_1d_pipeline_band1 (tile1);
+CREATE INDEX IF NOT EXISTS partial_tile_1d_pipeline_band1_tile2_idx ON possum.partial_tile_1d_pipeline_band1 (tile2);
+CREATE INDEX IF NOT EXISTS partial_tile_1d_pipeline_band1_tile3_idx ON possum.partial_tile_1d_pipeline_band1 (tile3);
+CREATE INDEX IF NOT EXISTS partial_tile_1d_pipeline_band1_tile4_idx ON possum.partial_tile_1d_pipeline_band1 (tile4);
+CREATE INDEX IF NOT EXISTS partial_tile_1d_pipeline_band1_number_sources_idx ON possum.partial_tile_1d_pipeline_band1 (number_sources);
+CREATE INDEX IF NOT EXISTS partial_tile_1d_pipeline_band2_observation_idx ON possum.partial_tile_1d_pipeline_band2 (observation);
+CREATE INDEX IF NOT EXISTS partial_tile_1d_pipeline_band2_tile1_idx ON possum.partial_tile_1d_pipeline_band2 (tile1);
+CREATE INDEX IF NOT EXISTS partial_tile_1d_pipeline_band2_tile2_idx ON possum.partial_tile_1d_pipeline_band2 (tile2);
+CREATE INDEX IF NOT EXISTS partial_tile_1d_pipeline_band2_tile3_idx ON possum.partial_tile_1d_pipeline_band2 (tile3);
+CREATE INDEX IF NOT EXISTS partial_tile_1d_pipeline_band2_tile4_idx ON possum.partial_tile_1d_pipeline_band2 (tile4);
+CREATE INDEX IF NOT EXISTS partial_tile_1d_pipeline_band2_number_sources_idx ON possum.partial_tile_1d_pipeline_band2 (number_sources);
+
+-- Substring lookups for text search terms: Django's icontains is UPPER(col::text) LIKE UPPER('%term%')
+CREATE INDEX IF NOT EXISTS observation_name_trgm_idx ON possum.observation USING gin (UPPER(name::text) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS observation_validated_state_trgm_idx ON possum.observation USING gin (UPPER(validated_state::text) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS associated_tile_name_trgm_idx ON possum.associated_tile USING gin (UPPER(name::text) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS partial_tile_1d_pipeline_band1_type_trgm_idx ON possum.partial_tile_1d_pipeline_band1 USING gin (UPPER(type::text) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS partial_tile_1d_pipeline_band1_1d_pipeline_trgm_idx ON possum.partial_tile_1d_pipeline_band1 USING gin (UPPER("1d_pipeline"::text) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS partial_tile_1d_pipeline_band2_type_trgm_idx ON possum.partial_tile_1d_pipeline_band2 USING gin (UPPER(type::text) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS partial_tile_1d_pipeline_band2_1d_pipeline_trgm_idx ON possum.partial_tile_1d_pipeline_band2 USING gin (UPPER("1d_pipeline"::text) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS observation_state_band1_trgm_idx ON possum.observation_state_band1 USING gin (
+    UPPER(name::text) gin_trgm_ops, UPPER("1d_pipeline_validation"::text) gin_trgm_ops,
+    UPPER(single_sb_1d_pipeline::text) gin_trgm_ops, UPPER(mfs_state::text) gin_trgm_ops, UPPER(cube_state::text) gin_trgm_ops
+);
+CREATE INDEX IF NOT EXISTS observation_state_band2_trgm_idx ON possum.observation_state_band2 USING gin (
+    UPPER(name::text) gin_trgm_ops, UPPER("1d_pipeline_validation"::text) gin_trgm_ops,
+    UPPER(single_sb_1d_pipeline::text) gin_trgm_ops, UPPER(mfs_state::text) gin_trgm_ops, UPPER(cube_state::text) gin_trgm_ops
+);
+CREATE INDEX IF NOT EXISTS tile_state_band1_trgm_idx ON possum.tile_state_band1 USING gin (
+    UPPER("3d_pipeline_val"::text) gin_trgm_ops, UPPER("3d_pipeline_ingest"::text) gin_trgm_ops,
+    UPPER("3d_pipeline_validator"::text) gin_trgm_ops, UPPER("3d_val_link"::text) gin_trgm_ops,
+    UPPER("3d_val_comments"::text) gin_trgm_ops, UPPER(mfs_state::text) gin_trgm_ops, UPPER(cube_state::text) gin_trgm_ops
+);
+CREATE INDEX IF NOT EXISTS tile_state_band2_trgm_idx ON possum.tile_state_band2 USING gin (
+    UPPER("3d_pipeline_val"::text) gin_trgm_ops, UPPER("3d_pipeline_ingest"::text) gin_trgm_ops,
+    UPPER("3d_pipeline_validator"::text) gin_trgm_ops, UPPER("3d_val_link"::text) gin_trgm_ops,
+    UPPER("3d_val_comments"::text) gin_trgm_ops, UPPER(mfs_state::text) gin_trgm_ops, UPPER(cube_state::text) gin_trgm_ops
+);
+
+ANALYZE possum.observation;
+ANALYZE possum.tile;
+ANALYZE possum.associated_tile;
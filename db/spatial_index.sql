@@ -0,0 +1,11 @@
+\c possum
+
+-- Spatial indexes for cone and box searches (possum/survey/spatial.py), using pgSphere.
+-- Queries must use the same expression, spoint(radians(ra_deg), radians(dec_deg)), to use them.
+CREATE EXTENSION IF NOT EXISTS pg_sphere;
+
+CREATE INDEX IF NOT EXISTS tile_position_idx ON possum.tile USING gist (spoint(radians(ra_deg), radians(dec_deg)));
+CREATE INDEX IF NOT EXISTS observation_position_idx ON possum.observation USING gist (spoint(radians(ra_deg), radians(dec_deg)));
+
+ANALYZE possum.tile;
+ANALYZE possum.observation;
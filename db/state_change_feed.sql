@@ -0,0 +1,83 @@
+\c possum
+
+-- Change feed for the processing state tables (possum/processing_states/feed.py)
+-- Every insert, update and delete is recorded in possum.state_change, and each statement is
+-- announced once on the state_change notification channel. xid is the writing transaction, which the
+-- feed uses to only return changes once all earlier transactions have finished.
+-- Old changes are removed with manage.py trim_state_changes (FEED_RETENTION).
+CREATE TABLE IF NOT EXISTS possum.state_change (
+    id bigserial primary key,
+    xid xid8 NOT NULL DEFAULT pg_current_xact_id(),
+    changed_at timestamp with time zone NOT NULL DEFAULT now(),
+    table_name text NOT NULL,
+    key text,
+    operation text NOT NULL,
+    data jsonb
+);
+CREATE INDEX IF NOT EXISTS state_change_xid_id_idx ON possum.state_change (xid, id);
+CREATE INDEX IF NOT EXISTS state_change_changed_at_idx ON possum.state_change (changed_at);
+
+-- Trigger arguments: table name reported in the feed, key column
+CREATE OR REPLACE FUNCTION possum.record_state_change() RETURNS trigger AS $$
+DECLARE
+    row_data jsonb;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        row_data := to_jsonb(OLD);
+    ELSE
+        row_data := to_jsonb(NEW);
+    END IF;
+    IF TG_OP = 'UPDATE' AND to_jsonb(OLD) = row_data THEN
+        RETURN NULL;
+    END IF;
+    INSERT INTO possum.state_change (table_name, key, operation, data)
+    VALUES (TG_ARGV[0], row_data ->> TG_ARGV[1], TG_OP, row_data);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- One notification per statement (and per table and transaction, as PostgreSQL folds identical
+-- notifications), the feed re-reads possum.state_change when woken. Trigger argument: table name
+CREATE OR REPLACE FUNCTION possum.notify_state_change() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('state_change', TG_ARGV[0]);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS state_change ON possum.observation_state_band1;
+CREATE TRIGGER state_change AFTER INSERT OR UPDATE OR DELETE ON possum.observation_state_band1
+    FOR EACH ROW EXECUTE FUNCTION possum.record_state_change('observation_state_band1', 'name');
+DROP TRIGGER IF EXISTS state_change_notify ON possum.observation_state_band1;
+CREATE TRIGGER state_change_notify AFTER INSERT OR UPDATE OR DELETE ON possum.observation_state_band1
+    FOR EACH STATEMENT EXECUTE FUNCTION possum.notify_state_change('observation_state_band1');
+DROP TRIGGER IF EXISTS state_change ON possum.observation_state_band2;
+CREATE TRIGGER state_change AFTER INSERT OR UPDATE OR DELETE ON possum.observation_state_band2
+    FOR EACH ROW EXECUTE FUNCTION possum.record_state_change('observation_state_band2', 'name');
+DROP TRIGGER IF EXISTS state_change_notify ON possum.observation_state_band2;
+CREATE TRIGGER state_change_notify AFTER INSERT OR UPDATE OR DELETE ON possum.observation_state_band2
+    FOR EACH STATEMENT EXECUTE FUNCTION possum.notify_state_change('observation_state_band2');
+DROP TRIGGER IF EXISTS state_change ON possum.tile_state_band1;
+CREATE TRIGGER state_change AFTER INSERT OR UPDATE OR DELETE ON possum.tile_state_band1
+    FOR EACH ROW EXECUTE FUNCTION possum.record_state_change('tile_state_band1', 'tile');
+DROP TRIGGER IF EXISTS state_change_notify ON possum.tile_state_band1;
+CREATE TRIGGER state_change_notify AFTER INSERT OR UPDATE OR DELETE ON possum.tile_state_band1
+    FOR EACH STATEMENT EXECUTE FUNCTION possum.notify_state_change('tile_state_band1');
+DROP TRIGGER IF EXISTS state_change ON possum.tile_state_band2;
+CREATE TRIGGER state_change AFTER INSERT OR UPDATE OR DELETE ON possum.tile_state_band2
+    FOR EACH ROW EXECUTE FUNCTION possum.record_state_change('tile_state_band2', 'tile');
+DROP TRIGGER IF EXISTS state_change_notify ON possum.tile_state_band2;
+CREATE TRIGGER state_change_notify AFTER INSERT OR UPDATE OR DELETE ON possum.tile_state_band2
+    FOR EACH STATEMENT EXECUTE FUNCTION possum.notify_state_change('tile_state_band2');
+DROP TRIGGER IF EXISTS state_change ON possum.partial_tile_1d_pipeline_band1;
+CREATE TRIGGER state_change AFTER INSERT OR UPDATE OR DELETE ON possum.partial_tile_1d_pipeline_band1
+    FOR EACH ROW EXECUTE FUNCTION possum.record_state_change('partial_tile_1d_pipeline_band1', 'id');
+DROP TRIGGER IF EXISTS state_change_notify ON possum.partial_tile_1d_pipeline_band1;
+CREATE TRIGGER state_change_notify AFTER INSERT OR UPDATE OR DELETE ON possum.partial_tile_1d_pipeline_band1
+    FOR EACH STATEMENT EXECUTE FUNCTION possum.notify_state_change('partial_tile_1d_pipeline_band1');
+DROP TRIGGER IF EXISTS state_change ON possum.partial_tile_1d_pipeline_band2;
+CREATE TRIGGER state_change AFTER INSERT OR UPDATE OR DELETE ON possum.partial_tile_1d_pipeline_band2
+    FOR EACH ROW EXECUTE FUNCTION possum.record_state_change('partial_tile_1d_pipeline_band2', 'id');
+DROP TRIGGER IF EXISTS state_change_notify ON possum.partial_tile_1d_pipeline_band2;
+CREATE TRIGGER state_change_notify AFTER INSERT OR UPDATE OR DELETE ON possum.partial_tile_1d_pipeline_band2
+    FOR EACH STATEMENT EXECUTE FUNCTION possum.notify_state_change('partial_tile_1d_pipeline_band2');
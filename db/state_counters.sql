@@ -0,0 +1,174 @@
+\c possum
+
+-- One transaction, so the triggers never run the function with arguments of an older version
+BEGIN;
+
+-- Incremental state counts for the survey progress dashboard (possum/processing_states/dashboard.py)
+-- NULL states are counted as ''.
+CREATE TABLE IF NOT EXISTS possum.state_count (
+    table_name text NOT NULL,
+    column_name text NOT NULL,
+    state text NOT NULL,
+    count bigint NOT NULL DEFAULT 0,
+    PRIMARY KEY (table_name, column_name, state)
+);
+
+-- Number of rows that moved into each state per day
+CREATE TABLE IF NOT EXISTS possum.state_history (
+    day date NOT NULL,
+    table_name text NOT NULL,
+    column_name text NOT NULL,
+    state text NOT NULL,
+    transitions bigint NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, table_name, column_name, state)
+);
+
+-- Changes not yet rolled up into state_count / state_history. Each statement appends its own rows,
+-- so concurrent writers never wait on a shared counter row. Read the totals from the
+-- state_count_total / state_history_total views; possum.rollup_state_counts() folds the deltas in.
+CREATE TABLE IF NOT EXISTS possum.state_count_delta (
+    table_name text NOT NULL,
+    column_name text NOT NULL,
+    state text NOT NULL,
+    count bigint NOT NULL
+);
+CREATE TABLE IF NOT EXISTS possum.state_history_delta (
+    day date NOT NULL,
+    table_name text NOT NULL,
+    column_name text NOT NULL,
+    state text NOT NULL,
+    transitions bigint NOT NULL
+);
+
+CREATE OR REPLACE VIEW possum.state_count_total AS
+SELECT table_name, column_name, state, sum(count)::bigint AS count FROM (
+    SELECT table_name, column_name, state, count FROM possum.state_count
+    UNION ALL SELECT table_name, column_name, state, count FROM possum.state_count_delta
+) c GROUP BY table_name, column_name, state;
+
+CREATE OR REPLACE VIEW possum.state_history_total AS
+SELECT day, table_name, column_name, state, sum(transitions)::bigint AS transitions FROM (
+    SELECT day, table_name, column_name, state, transitions FROM possum.state_history
+    UNION ALL SELECT day, table_name, column_name, state, transitions FROM possum.state_history_delta
+) h GROUP BY day, table_name, column_name, state;
+
+-- Fold the committed deltas into state_count / state_history (run periodically, see README).
+-- Deltas of transactions still in progress are not visible and are left for the next run.
+CREATE OR REPLACE FUNCTION possum.rollup_state_counts() RETURNS void AS $$
+BEGIN
+    WITH moved AS (DELETE FROM possum.state_count_delta RETURNING *)
+    INSERT INTO possum.state_count AS c (table_name, column_name, state, count)
+    SELECT table_name, column_name, state, sum(count) FROM moved GROUP BY 1, 2, 3 ORDER BY 1, 2, 3
+    ON CONFLICT (table_name, column_name, state) DO UPDATE SET count = c.count + EXCLUDED.count;
+
+    WITH moved AS (DELETE FROM possum.state_history_delta RETURNING *)
+    INSERT INTO possum.state_history AS h (day, table_name, column_name, state, transitions)
+    SELECT day, table_name, column_name, state, sum(transitions) FROM moved GROUP BY 1, 2, 3, 4 ORDER BY 1, 2, 3, 4
+    ON CONFLICT (day, table_name, column_name, state) DO UPDATE SET transitions = h.transitions + EXCLUDED.transitions;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Statement level trigger using transition tables (old_rows / new_rows), so a bulk update of
+-- many rows appends one delta row per state. Trigger arguments: table name, key column, state columns...
+-- On a band-partitioned table (db/band_partitions.sql) the table name is a format() pattern that
+-- is filled in with the band of each row, e.g. 'tile_state_band%s', and rows are keyed by (key, band).
+-- Counts change by the net change per state. Transitions are counted per row, by pairing old and
+-- new rows on the key, so a row that moves A -> B while another moves B -> A is counted twice.
+CREATE OR REPLACE FUNCTION possum.count_states() RETURNS trigger AS $$
+DECLARE
+    col text;
+    label text;
+    keys text;
+    source text;
+    moved text;
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = TG_RELID) = 'p' THEN
+        label := format('format(%L, band)', TG_ARGV[0]);
+        keys := format('%I, band', TG_ARGV[1]);
+    ELSE
+        label := quote_literal(TG_ARGV[0]);
+        keys := quote_ident(TG_ARGV[1]);
+    END IF;
+    FOR i IN 2 .. TG_NARGS - 1 LOOP
+        col := TG_ARGV[i];
+        IF TG_OP = 'INSERT' THEN
+            source := format('SELECT %3$s AS label, coalesce(%1$I::text, %2$L) AS state, 1 AS n FROM new_rows', col, '', label);
+            moved := source;
+        ELSIF TG_OP = 'DELETE' THEN
+            source := format('SELECT %3$s AS label, coalesce(%1$I::text, %2$L) AS state, -1 AS n FROM old_rows', col, '', label);
+            moved := NULL;
+        ELSE
+            source := format('SELECT %3$s AS label, coalesce(%1$I::text, %2$L) AS state, -1 AS n FROM old_rows '
+                             'UNION ALL SELECT %3$s, coalesce(%1$I::text, %2$L), 1 FROM new_rows', col, '', label);
+            moved := format('SELECT %3$s AS label, coalesce(n.%1$I::text, %2$L) AS state, 1 AS n '
+                            'FROM old_rows o JOIN new_rows n USING (%4$s) WHERE o.%1$I IS DISTINCT FROM n.%1$I',
+                            col, '', label, keys);
+        END IF;
+        EXECUTE format($q$
+            INSERT INTO possum.state_count_delta (table_name, column_name, state, count)
+            SELECT label, %2$L, state, sum(n) FROM (%1$s) s GROUP BY label, state HAVING sum(n) <> 0
+        $q$, source, col);
+        IF moved IS NOT NULL THEN
+            EXECUTE format($q$
+                INSERT INTO possum.state_history_delta (day, table_name, column_name, state, transitions)
+                SELECT current_date, label, %2$L, state, sum(n) FROM (%1$s) s GROUP BY label, state
+            $q$, moved, col);
+        END IF;
+    END LOOP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Rebuild the counts of one table from scratch (blocks writes to the table while counting)
+CREATE OR REPLACE FUNCTION possum.recount_states(label text, tbl regclass, columns text[]) RETURNS void AS $$
+DECLARE
+    col text;
+BEGIN
+    EXECUTE format('LOCK TABLE %s IN SHARE MODE', tbl);
+    DELETE FROM possum.state_count WHERE table_name = label;
+    DELETE FROM possum.state_count_delta WHERE table_name = label;
+    FOREACH col IN ARRAY columns LOOP
+        EXECUTE format('INSERT INTO possum.state_count (table_name, column_name, state, count) '
+                       'SELECT %1$L, %2$L, coalesce(%2$I::text, %3$L), count(*) FROM %4$s GROUP BY 3',
+                       label, col, '', tbl);
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Create the counting triggers for a table and backfill its counts
+-- (partitioned tables are not backfilled: their partitions are counted under their own names)
+DROP FUNCTION IF EXISTS possum.track_states(text, regclass, text[]);
+CREATE OR REPLACE FUNCTION possum.track_states(label text, tbl regclass, key text, columns text[]) RETURNS void AS $$
+DECLARE
+    args text;
+BEGIN
+    SELECT string_agg(quote_literal(a), ', ') INTO args FROM unnest(ARRAY[label, key] || columns) a;
+    EXECUTE format('DROP TRIGGER IF EXISTS count_states_insert ON %s', tbl);
+    EXECUTE format('DROP TRIGGER IF EXISTS count_states_update ON %s', tbl);
+    EXECUTE format('DROP TRIGGER IF EXISTS count_states_delete ON %s', tbl);
+    EXECUTE format('CREATE TRIGGER count_states_insert AFTER INSERT ON %s REFERENCING NEW TABLE AS new_rows '
+                   'FOR EACH STATEMENT EXECUTE FUNCTION possum.count_states(%s)', tbl, args);
+    EXECUTE format('CREATE TRIGGER count_states_update AFTER UPDATE ON %s REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows '
+                   'FOR EACH STATEMENT EXECUTE FUNCTION possum.count_states(%s)', tbl, args);
+    EXECUTE format('CREATE TRIGGER count_states_delete AFTER DELETE ON %s REFERENCING OLD TABLE AS old_rows '
+                   'FOR EACH STATEMENT EXECUTE FUNCTION possum.count_states(%s)', tbl, args);
+    IF (SELECT relkind FROM pg_class WHERE oid = tbl) <> 'p' THEN
+        PERFORM possum.recount_states(label, tbl, columns);
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT possum.track_states('observation_state_band1', 'possum.observation_state_band1', 'name', ARRAY['1d_pipeline_validation', 'mfs_state', 'cube_state']);
+SELECT possum.track_states('observation_state_band2', 'possum.observation_state_band2', 'name', ARRAY['1d_pipeline_validation', 'mfs_state', 'cube_state']);
+SELECT possum.track_states('tile_state_band1', 'possum.tile_state_band1', 'tile', ARRAY['3d_pipeline_val', 'mfs_state', 'cube_state']);
+SELECT possum.track_states('tile_state_band2', 'possum.tile_state_band2', 'tile', ARRAY['3d_pipeline_val', 'mfs_state', 'cube_state']);
+SELECT possum.track_states('partial_tile_1d_pipeline_band1', 'possum.partial_tile_1d_pipeline_band1', 'id', ARRAY['1d_pipeline']);
+SELECT possum.track_states('partial_tile_1d_pipeline_band2', 'possum.partial_tile_1d_pipeline_band2', 'id', ARRAY['1d_pipeline']);
+-- Band-partitioned parent tables, once db/band_partitions.sql has been applied
+SELECT possum.track_states('observation_state_band%s', t, 'name', ARRAY['1d_pipeline_validation', 'mfs_state', 'cube_state'])
+FROM to_regclass('possum.observation_state') t WHERE t IS NOT NULL;
+SELECT possum.track_states('tile_state_band%s', t, 'tile', ARRAY['3d_pipeline_val', 'mfs_state', 'cube_state'])
+FROM to_regclass('possum.tile_state') t WHERE t IS NOT NULL;
+SELECT possum.track_states('partial_tile_1d_pipeline_band%s', t, 'id', ARRAY['1d_pipeline'])
+FROM to_regclass('possum.partial_tile_1d_pipeline') t WHERE t IS NOT NULL;
+COMMIT;
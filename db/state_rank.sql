@@ -0,0 +1,82 @@
+\c possum
+
+-- Stored sort key for the state admin changelists (possum/processing_states/admin.py)
+-- state_rank ranks the main state of each row (e.g. Completed, Running, Failed, none), and the composite
+-- indexes below match the full changelist ordering, including the primary key tie-breaker Django adds,
+-- so the first page is read from an index instead of sorting the whole table.
+-- The rank is set by a BEFORE trigger rather than a generated column because Django writes every
+-- column on save. Requires the band-partitioned tables (db/band_partitions.sql); the column, triggers
+-- and indexes are created on the parent tables and apply to every band.
+
+-- Partial tile 1d_pipeline and observation 1d_pipeline_validation
+CREATE OR REPLACE FUNCTION possum.pipeline_state_rank(state text) RETURNS smallint AS $$
+    SELECT CASE state WHEN 'Completed' THEN 0 WHEN 'Running' THEN 1 WHEN 'Failed' THEN 2 ELSE 3 END::smallint
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Tile 3d_pipeline_val
+
+CREATE OR REPLACE FUNCTION possum.tile_state_rank(state text) RETURNS smallint AS $$
+    SELECT CASE state WHEN 'Good' THEN 0 WHEN 'Bad' THEN 1 WHEN 'Running' THEN 2 WHEN 'Failed' THEN 3
+                      WHEN 'WaitingForValidation' THEN 4 ELSE 5 END::smallint
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION possum.set_partial_tile_state_rank() RETURNS trigger AS $$
+BEGIN
+    NEW.state_rank := possum.pipeline_state_rank(NEW."1d_pipeline");
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION possum.set_observation_state_rank() RETURNS trigger AS $$
+BEGIN
+    NEW.state_rank := possum.pipeline_state_rank(NEW."1d_pipeline_validation");
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION possum.set_tile_state_rank() RETURNS trigger AS $$
+BEGIN
+    NEW.state_rank := possum.tile_state_rank(NEW."3d_pipeline_val");
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+BEGIN;
+
+ALTER TABLE possum.partial_tile_1d_pipeline ADD COLUMN IF NOT EXISTS state_rank smallint;
+ALTER TABLE possum.observation_state ADD COLUMN IF NOT EXISTS state_rank smallint;
+ALTER TABLE possum.tile_state ADD COLUMN IF NOT EXISTS state_rank smallint;
+
+-- Backfill without firing the change feed and state counter triggers (the states do not change)
+SET LOCAL session_replication_role = replica;
+UPDATE possum.partial_tile_1d_pipeline SET state_rank = possum.pipeline_state_rank("1d_pipeline")
+WHERE state_rank IS DISTINCT FROM possum.pipeline_state_rank("1d_pipeline");
+UPDATE possum.observation_state SET state_rank = possum.pipeline_state_rank("1d_pipeline_validation")
+WHERE state_rank IS DISTINCT FROM possum.pipeline_state_rank("1d_pipeline_validation");
+UPDATE possum.tile_state SET state_rank = possum.tile_state_rank("3d_pipeline_val")
+WHERE state_rank IS DISTINCT FROM possum.tile_state_rank("3d_pipeline_val");
+SET LOCAL session_replication_role = origin;
+
+DROP TRIGGER IF EXISTS state_rank ON possum.partial_tile_1d_pipeline;
+CREATE TRIGGER state_rank BEFORE INSERT OR UPDATE ON possum.partial_tile_1d_pipeline
+    FOR EACH ROW EXECUTE FUNCTION possum.set_partial_tile_state_rank();
+DROP TRIGGER IF EXISTS state_rank ON possum.observation_state;
+CREATE TRIGGER state_rank BEFORE INSERT OR UPDATE ON possum.observation_state
+    FOR EACH ROW EXECUTE FUNCTION possum.set_observation_state_rank();
+DROP TRIGGER IF EXISTS state_rank ON possum.tile_state;
+CREATE TRIGGER state_rank BEFORE INSERT OR UPDATE ON possum.tile_state
+    FOR EACH ROW EXECUTE FUNCTION possum.set_tile_state_rank();
+
+-- Changelist orderings: state_rank, then the admin's secondary keys, then -pk
+CREATE INDEX IF NOT EXISTS partial_tile_1d_pipeline_state_rank_idx
+    ON possum.partial_tile_1d_pipeline (state_rank, "1d_pipeline" DESC, id DESC);
+CREATE INDEX IF NOT EXISTS observation_state_state_rank_idx
+    ON possum.observation_state (state_rank, single_sb_1d_pipeline DESC, cube_state DESC, mfs_state DESC, name DESC);
+CREATE INDEX IF NOT EXISTS tile_state_state_rank_idx
+    ON possum.tile_state (state_rank, tile DESC);
+
+COMMIT;
+
+ANALYZE possum.partial_tile_1d_pipeline;
+ANALYZE possum.observation_state;
+ANALYZE possum.tile_state;
@@ -0,0 +1,31 @@
+\c possum
+
+-- Number of band 1 and band 2 observations covering each tile (precomputed for the tile admin list)
+CREATE TABLE IF NOT EXISTS possum.tile_band_count (
+    tile bigint primary key REFERENCES possum.tile ("tile") ON DELETE CASCADE,
+    band1_count int NOT NULL DEFAULT 0,
+    band2_count int NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS tile_band_count_band1_count_idx ON possum.tile_band_count (band1_count);
+CREATE INDEX IF NOT EXISTS tile_band_count_band2_count_idx ON possum.tile_band_count (band2_count);
+
+-- Recompute the counts from the tile map. Only rows whose counts changed are written.
+-- Called by the ingest scripts in db/data after the tile map has been loaded.
+CREATE OR REPLACE FUNCTION possum.refresh_tile_band_count() RETURNS void AS $$
+BEGIN
+    INSERT INTO possum.tile_band_count AS c (tile, band1_count, band2_count)
+    SELECT t.tile,
+           count(o.name) FILTER (WHERE o.band = 1),
+           count(o.name) FILTER (WHERE o.band = 2)
+    FROM possum.tile t
+    LEFT JOIN possum.associated_tile a ON a.tile = t.tile
+    LEFT JOIN possum.observation o ON o.name = a.name
+    GROUP BY t.tile
+    ON CONFLICT (tile) DO UPDATE
+        SET band1_count = EXCLUDED.band1_count,
+            band2_count = EXCLUDED.band2_count
+        WHERE (c.band1_count, c.band2_count) IS DISTINCT FROM (EXCLUDED.band1_count, EXCLUDED.band2_count);
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT possum.refresh_tile_band_count();
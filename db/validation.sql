@@ -1,8 +1,8 @@
 \c possum
 
 CREATE TABLE possum.validation (
-    id bigint primary key,
-    field_id varchar,
+    id bigint generated by default as identity primary key,
+    field_id varchar unique,
     project_code varchar,
     link text,
     observation_start_time timestamp without time zone,
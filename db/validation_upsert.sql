@@ -0,0 +1,26 @@
+\c possum
+
+-- Prepare an existing possum.validation table for report ingest (manage.py ingest_validation and
+-- POST /api/validation/upload/), which upserts on field_id:
+-- - id gets an identity default, continuing after the largest existing id
+-- - field_id becomes unique (fails, and changes nothing, if there are duplicate field_ids)
+BEGIN;
+
+DO $$
+DECLARE
+    duplicates text;
+BEGIN
+    SELECT string_agg(field_id, ', ') INTO duplicates
+    FROM (SELECT field_id FROM possum.validation WHERE field_id IS NOT NULL GROUP BY field_id HAVING count(*) > 1) d;
+    IF duplicates IS NOT NULL THEN
+        RAISE EXCEPTION 'Duplicate validation rows for field_id: %', duplicates;
+    END IF;
+END $$;
+
+ALTER TABLE possum.validation ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY;
+SELECT setval(pg_get_serial_sequence('possum.validation', 'id'), COALESCE(max(id), 0) + 1, false)
+FROM possum.validation;
+
+ALTER TABLE possum.validation ADD CONSTRAINT validation_field_id_key UNIQUE (field_id);
+
+COMMIT;
@@ -0,0 +1,20 @@
+\c possum
+
+-- Leases for the 1D pipeline work queue (possum/processing_states/queue.py)
+-- A region is pending while "1d_pipeline" is NULL. Claiming sets it to 'Running' with a lease owner
+-- and expiry; workers extend the lease with heartbeats, and a region whose lease has expired can be
+-- claimed again. Requires the band-partitioned tables (db/band_partitions.sql).
+BEGIN;
+
+ALTER TABLE possum.partial_tile_1d_pipeline
+    ADD COLUMN IF NOT EXISTS lease_owner text,
+    ADD COLUMN IF NOT EXISTS lease_expires timestamp with time zone,
+    ADD COLUMN IF NOT EXISTS attempts integer NOT NULL DEFAULT 0;
+
+-- Pending regions in claim order, and running regions by lease expiry (both small partial indexes)
+CREATE INDEX IF NOT EXISTS partial_tile_1d_pipeline_pending_idx
+    ON possum.partial_tile_1d_pipeline (band, id) WHERE "1d_pipeline" IS NULL;
+CREATE INDEX IF NOT EXISTS partial_tile_1d_pipeline_lease_idx
+    ON possum.partial_tile_1d_pipeline (band, lease_expires) WHERE "1d_pipeline" = 'Running';
+
+COMMIT;
@@ -0,0 +1,14 @@
+# Gunicorn configuration, read from the working directory on start up.
+# Set ASGI=True to serve possum.asgi with uvicorn workers (async request path),
+# otherwise possum.wsgi is served with threaded sync workers.
+import os
+
+bind = '0.0.0.0:8000'
+workers = int(os.environ.get('GUNICORN_WORKERS', 4))
+
+if os.environ.get('ASGI', 'False').lower() in ('1', 'true', 'yes'):
+    wsgi_app = 'possum.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+else:
+    wsgi_app = 'possum.wsgi:application'
+    threads = int(os.environ.get('GUNICORN_THREADS', 2))
@@ -0,0 +1,32 @@
+from contextvars import ContextVar
+
+from django.conf import settings
+
+
+REPLICA = 'replica'
+# Apps whose tables are read from the replica. Sessions, users and the admin log always use the
+# primary, so logins and permission changes take effect immediately.
+REPLICA_APPS = ('survey', 'processing_states')
+
+# Set by survey.middleware.replica.ReplicaMiddleware for requests that may read from the replica
+use_replica = ContextVar('use_replica', default=False)
+
+
+class ReplicaRouter:
+    """Read survey and processing state tables from the replica database when the current
+    request allows it. All writes, and all reads outside such requests, use the primary."""
+
+    def db_for_read(self, model, **hints):
+        if use_replica.get() and model._meta.app_label in REPLICA_APPS and REPLICA in settings.DATABASES:
+            return REPLICA
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
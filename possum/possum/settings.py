@@ -90,6 +90,17 @@ if not LOCAL:
 
     AUTH_GROUPS = env('AUTH_GROUPS').split(' ')
 
+    # Token introspection results are cached per token (survey/middleware/cache.py)
+    INTROSPECTION_CACHE_TTL = env.int('INTROSPECTION_CACHE_TTL', default=60)
+    INTROSPECTION_CACHE_SIZE = env.int('INTROSPECTION_CACHE_SIZE', default=1024)
+    # Timeout (seconds) of the async introspection request (ASGI deployment)
+    INTROSPECTION_TIMEOUT = env.float('INTROSPECTION_TIMEOUT', default=5.0)
+
+    # Verify access tokens locally (PUBLIC_KEY or JWKS_URL) and only introspect to check for revocation
+    LOCAL_TOKEN_VERIFICATION = env.bool('LOCAL_TOKEN_VERIFICATION', default=False)
+    JWKS_URL = env('JWKS_URL', default=None)
+    REVOCATION_CHECK_INTERVAL = env.int('REVOCATION_CHECK_INTERVAL', default=300)
+
 ## End Social Auth
 
 SOCIAL_AUTH_PIPELINE = (
@@ -149,6 +160,42 @@ DATABASES = {
     },
 }
 
+# Optional read replica (possum/db_router.py): read-only admin pages and exports read the survey and
+# processing state tables from it. Clients are pinned to the primary for REPLICA_PIN_SECONDS after a write.
+DATABASE_REPLICA_HOST = env('DATABASE_REPLICA_HOST', default=None)
+REPLICA_PIN_SECONDS = env.int('REPLICA_PIN_SECONDS', default=30)
+REPLICA_READ_PATHS = ('/admin/', '/api/export/', '/api/search/')
+if DATABASE_REPLICA_HOST:
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': DATABASE_REPLICA_HOST,
+        'PORT': env('DATABASE_REPLICA_PORT', default=DATABASE_PORT),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_ROUTERS = ['possum.db_router.ReplicaRouter']
+    MIDDLEWARE.insert(1, 'survey.middleware.replica.ReplicaMiddleware')
+
+# Machine-facing JSON API (processing_states/urls.py)
+PIPELINE_API_TOKEN = env('PIPELINE_API_TOKEN', default=None)
+API_MAX_BATCH_SIZE = env.int('API_MAX_BATCH_SIZE', default=5000)
+FEED_MAX_LIMIT = env.int('FEED_MAX_LIMIT', default=5000)
+FEED_MAX_TIMEOUT = env.int('FEED_MAX_TIMEOUT', default=60)
+FEED_STREAM_MAX_AGE = env.int('FEED_STREAM_MAX_AGE', default=300)
+# Open long polls and streams per worker process; keep below GUNICORN_THREADS under WSGI
+FEED_MAX_CONNECTIONS = env.int('FEED_MAX_CONNECTIONS', default=1)
+# Days of possum.state_change kept by manage.py trim_state_changes
+FEED_RETENTION = env.int('FEED_RETENTION', default=30)
+SPATIAL_SEARCH_MAX_RADIUS = env.float('SPATIAL_SEARCH_MAX_RADIUS', default=30.0)
+SPATIAL_SEARCH_MAX_LIMIT = env.int('SPATIAL_SEARCH_MAX_LIMIT', default=10000)
+VALIDATION_UPLOAD_MAX_ERRORS = env.int('VALIDATION_UPLOAD_MAX_ERRORS', default=100)
+QUEUE_DEFAULT_LEASE = env.int('QUEUE_DEFAULT_LEASE', default=600)
+QUEUE_MAX_LEASE = env.int('QUEUE_MAX_LEASE', default=86400)
+QUEUE_MAX_CLAIM = env.int('QUEUE_MAX_CLAIM', default=1000)
+QUEUE_MAX_ATTEMPTS = env.int('QUEUE_MAX_ATTEMPTS', default=5)
+
+# Admin changelists use the PostgreSQL row estimate above this many rows (see survey/paginator.py)
+ESTIMATED_COUNT_THRESHOLD = env.int('ESTIMATED_COUNT_THRESHOLD', default=10000)
+
 
 
 # Password validation
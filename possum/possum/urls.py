@@ -6,6 +6,7 @@ from django.contrib.auth import views as auth_views
 from django.views.generic.base import RedirectView
 
 from survey import views
+from processing_states import views as processing_states_views
 
 admin.site.site_header = "POSSUM Survey"
 admin.site.site_title = "POSSUM Survey"
@@ -19,8 +20,11 @@ if settings.LOCAL is False:
 
 urlpatterns += [
     path('', RedirectView.as_view(url=reverse_lazy('admin:index'))),
+    path("admin/dashboard/", processing_states_views.dashboard, name="dashboard"),
     path("admin/", admin.site.urls),
     path("oauth/", include('social_django.urls', namespace="social")),
+    path("api/", include('processing_states.urls')),
+    path("api/", include('survey.urls')),
     # Password reset links
     path('password_reset/', auth_views.PasswordResetView.as_view(), name='password_reset'),
     path('password_reset/done/', auth_views.PasswordResetDoneView.as_view(), name='password_reset_done'),
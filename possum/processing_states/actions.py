@@ -0,0 +1,106 @@
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.contrib.admin.models import LogEntry, CHANGE
+from django.contrib.admin.options import get_content_type_for_model
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count
+from django.template.response import TemplateResponse
+
+
+PREVIEW_ROWS = 50
+
+
+class BulkStateForm(forms.Form):
+    field = forms.ChoiceField()
+    value = forms.CharField(required=False, help_text='Leave empty to clear the value')
+
+    def __init__(self, model, fields, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.model = model
+        self.fields['field'].choices = [(f, model._meta.get_field(f).column) for f in fields]
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if 'field' not in cleaned_data:
+            return cleaned_data
+        field = self.model._meta.get_field(cleaned_data['field'])
+        try:
+            cleaned_data['value'] = field.clean(cleaned_data.get('value') or None, None)
+        except ValidationError as e:
+            self.add_error('value', e)
+        return cleaned_data
+
+
+class BulkStateActionMixin:
+    """Admin action that sets one state field on every selected row.
+
+    The action first renders a preview of the selection and the current values of each
+    field in bulk_state_fields. On confirmation the rows that do not already have the new
+    value are changed with a single UPDATE, and one admin log entry per changed row
+    records the old and new value.
+    """
+    bulk_state_fields = ()
+    actions = ['bulk_set_state']
+
+    @admin.action(description='Set state of selected %(verbose_name_plural)s', permissions=['change'])
+    def bulk_set_state(self, request, queryset):
+        queryset = queryset.order_by()
+        form = BulkStateForm(self.model, self.bulk_state_fields,
+                             request.POST if 'apply' in request.POST else None)
+        if 'apply' in request.POST and form.is_valid():
+            self.apply_bulk_state(request, queryset, form.cleaned_data['field'], form.cleaned_data['value'])
+            return None
+
+        opts = self.model._meta
+        selected = queryset.count()
+        current = [
+            (opts.get_field(f).column,
+             queryset.values_list(f).annotate(n=Count('pk')).order_by('-n'))
+            for f in self.bulk_state_fields
+        ]
+        choices = {opts.get_field(f).column: [c[0] for c in opts.get_field(f).choices or ()]
+                   for f in self.bulk_state_fields}
+        select_across = request.POST.get('select_across') == '1'
+        context = {
+            **self.admin_site.each_context(request),
+            'title': f'Set state of {selected} {opts.verbose_name_plural}',
+            'opts': opts,
+            'app_label': opts.app_label,
+            'form': form,
+            'selected': selected,
+            'current': current,
+            'choices': choices,
+            'preview': queryset[:PREVIEW_ROWS],
+            'remaining': max(selected - PREVIEW_ROWS, 0),
+            'select_across': select_across,
+            'selected_pks': request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+        }
+        return TemplateResponse(request, 'processing_states/bulk_state_preview.html', context)
+
+    def apply_bulk_state(self, request, queryset, field, value):
+        column = self.model._meta.get_field(field).column
+        if value is None:
+            changing = queryset.exclude(**{f'{field}__isnull': True})
+        else:
+            changing = queryset.exclude(**{field: value})
+
+        with transaction.atomic():
+            old_values = list(changing.select_for_update(of=('self',)).values_list('pk', field))
+            pks = [pk for pk, _ in old_values]
+            updated = self.model._default_manager.filter(pk__in=pks).update(**{field: value})
+            content_type = get_content_type_for_model(self.model)
+            LogEntry.objects.bulk_create([
+                LogEntry(
+                    user_id=request.user.pk,
+                    content_type_id=content_type.pk,
+                    object_id=str(pk),
+                    object_repr=str(self.model(pk=pk))[:200],
+                    action_flag=CHANGE,
+                    change_message=f'Bulk action: set {column} from {old!r} to {value!r}',
+                ) for pk, old in old_values
+            ])
+
+        self.message_user(request, f'Set {column} to {value!r} on {updated} rows', messages.SUCCESS)
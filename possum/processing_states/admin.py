@@ -1,9 +1,11 @@
 from django.contrib import admin
-from django.db.models import Case, When, Value, IntegerField
 from django.utils.html import format_html
 from .models import (ObservationStatesBand1, ObservationStatesBand2,
                      PartialTilePipelineRegionsBand1, PartialTilePipelineRegionsBand2,
                      TileStatesBand1, TileStatesBand2)
+from survey.paginator import EstimatedCountPaginator
+from survey.search import IndexedSearchMixin
+from .actions import BulkStateActionMixin
 
 def pipeline_state_colour(state):
     colour = 'DodgerBlue'
@@ -17,12 +19,17 @@ def pipeline_state_colour(state):
         colour = 'Tomato'
     return colour
 
-class PartialTile1DBaseAdmin(admin.ModelAdmin):
+class PartialTile1DBaseAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     list_display = ('id', 'observation', 'sbid', 'tile1', 'tile2', 'tile3',
                      'tile4', 'type', 'number_sources', '_1d_pipeline')
     search_fields = ('id', 'observation__name', 'observation__sbid', 'tile1__tile', 'tile2__tile', 'tile3__tile',
                      'tile4__tile', 'type', 'number_sources', '_1d_pipeline')
+    exact_search_fields = ('observation__sbid',)
     readonly_fields = ('sbid',)
+    # Completed, Running, Failed, NULL last (state_rank and its index: db/state_rank.sql)
+    ordering = ('state_rank', '-_1d_pipeline')
 
     def has_add_permission(self, request, obj=None):
         return True
@@ -33,23 +40,16 @@ class PartialTile1DBaseAdmin(admin.ModelAdmin):
     def has_delete_permission(self, request, obj=None):
         return True
 
-    def get_queryset(self, request):
-        qs = super(PartialTile1DBaseAdmin, self).get_queryset(request)
-        return qs.annotate(
-            complete_first=Case(
-                When(_1d_pipeline='Completed', then=Value(0)),
-                When(_1d_pipeline='Running', then=Value(1)),
-                When(_1d_pipeline='Failed', then=Value(2)),
-                default=Value(3),
-                output_field=IntegerField()
-            )
-        ).order_by('complete_first', '-_1d_pipeline')
-        # default ordering: Completed, Running, Failed, NULL last
-
-class ObservationStatesBaseAdmin(admin.ModelAdmin):
+class ObservationStatesBaseAdmin(BulkStateActionMixin, IndexedSearchMixin, admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     # only comments and 1d_pipeline_validation can be edited (to be able to rerun failed ones)
     readonly_fields = ('name', 'single_SB_1D_pipeline', 'colour_mfs_state', 'mfs_update', 'colour_cube_state', 'cube_update')    
     search_fields = ('name__name', 'name__sbid', '_1d_pipeline_validation', 'single_SB_1D_pipeline', 'mfs_state', 'mfs_update', 'cube_state', 'cube_update')
+    exact_search_fields = ('name__sbid',)
+    bulk_state_fields = ('_1d_pipeline_validation', 'comments')
+    # Completed, Running, Failed, NULL last (state_rank and its index: db/state_rank.sql)
+    ordering = ('state_rank', '-single_SB_1D_pipeline', '-cube_state', '-mfs_state')
     fields = ('name', '_1d_pipeline_validation', 'single_SB_1D_pipeline', 'comments', 'colour_mfs_state', 'mfs_update', 'colour_cube_state', 'cube_update')
     list_display = fields
 
@@ -86,26 +86,18 @@ class ObservationStatesBaseAdmin(admin.ModelAdmin):
     colour_cube_state.admin_order_field = 'cube_state'
     colour_cube_state.short_description = 'cube state'
 
-    def get_queryset(self, request):
-        qs = super(ObservationStatesBaseAdmin, self).get_queryset(request)
-        return qs.annotate(
-            complete_first=Case(
-                When(_1d_pipeline_validation='Completed', then=Value(0)),
-                When(_1d_pipeline_validation='Running', then=Value(1)),
-                When(_1d_pipeline_validation='Failed', then=Value(2)),
-                default=Value(3),
-                output_field=IntegerField()
-            )
-        ).order_by('complete_first', '-single_SB_1D_pipeline', '-cube_state', '-mfs_state')
-        # default ordering: Completed, Running, Failed, NULL last
-
-class TileStatesBaseAdmin(admin.ModelAdmin):
+class TileStatesBaseAdmin(BulkStateActionMixin, IndexedSearchMixin, admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     # Make sure 3d_val_comments can be updated
     readonly_fields = ('tile', '_3d_pipeline', '_3d_pipeline_ingest', '_3d_val_url',
                        'colour_mfs_state', 'colour_cube_state')
     search_fields = ('tile__tile', '_3d_pipeline', '_3d_pipeline_val',
                      '_3d_pipeline_ingest', '_3d_pipeline_validator', '_3d_val_link',
                      '_3d_val_comments', 'mfs_state', 'cube_state')
+    bulk_state_fields = ('_3d_pipeline_val', '_3d_pipeline_validator', '_3d_val_comments')
+    # Good, Bad, Running, Failed, WaitingForValidation, NULL last (state_rank and its index: db/state_rank.sql)
+    ordering = ('state_rank',)
     # Make sure 3d_val_link appears as links, and the colour coding works for mfs_state and cube_state
     fields = ('tile', '_3d_pipeline', '_3d_pipeline_val',
                      '_3d_pipeline_ingest', '_3d_pipeline_validator', '_3d_val_url',
@@ -155,21 +147,6 @@ class TileStatesBaseAdmin(admin.ModelAdmin):
     def has_delete_permission(self, request, obj=None):
         return False
 
-    def get_queryset(self, request):
-        qs = super().get_queryset(request)
-        return qs.annotate(
-            complete_first=Case(
-                When(_3d_pipeline_val='Good', then=Value(0)),
-                When(_3d_pipeline_val='Bad', then=Value(1)),
-                When(_3d_pipeline_val='Running', then=Value(2)),
-                When(_3d_pipeline_val='Failed', then=Value(3)),
-                When(_3d_pipeline_val='WaitingForValidation', then=Value(4)),
-                default=Value(5),
-                output_field=IntegerField()
-            )
-        ).order_by('complete_first')
-    # default ordering: WGood, Bad, Running, Failed, WaitingForValidation, NULL last
-
 admin.site.register(PartialTilePipelineRegionsBand1, PartialTile1DBaseAdmin)
 admin.site.register(PartialTilePipelineRegionsBand2, PartialTile1DBaseAdmin)
 admin.site.register(ObservationStatesBand1, ObservationStatesBaseAdmin)
@@ -0,0 +1,163 @@
+from collections import defaultdict
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+
+from .models import (ObservationStatesBand1, ObservationStatesBand2,
+                     PartialTilePipelineRegionsBand1, PartialTilePipelineRegionsBand2,
+                     TileStatesBand1, TileStatesBand2)
+
+
+OBSERVATION_STATE_FIELDS = ('_1d_pipeline_validation', 'single_SB_1D_pipeline', 'comments',
+                            'mfs_update', 'mfs_state', 'cube_update', 'cube_state')
+TILE_STATE_FIELDS = ('_3d_pipeline', '_3d_pipeline_val', '_3d_pipeline_ingest', '_3d_pipeline_validator',
+                     '_3d_val_link', '_3d_val_comments', 'cube_state', 'mfs_state')
+PARTIAL_TILE_FIELDS = ('_1d_pipeline', 'number_sources')
+
+# Tables that can be updated through the API (by table name) and the fields that can be changed
+RESOURCES = {
+    model._meta.db_table: (model, fields) for model, fields in (
+        (ObservationStatesBand1, OBSERVATION_STATE_FIELDS),
+        (ObservationStatesBand2, OBSERVATION_STATE_FIELDS),
+        (TileStatesBand1, TILE_STATE_FIELDS),
+        (TileStatesBand2, TILE_STATE_FIELDS),
+        (PartialTilePipelineRegionsBand1, PARTIAL_TILE_FIELDS),
+        (PartialTilePipelineRegionsBand2, PARTIAL_TILE_FIELDS),
+    )
+}
+
+
+class BulkUpdateError(Exception):
+    pass
+
+
+def _field(model, fields, name):
+    """Look up an updatable field by model field name or database column name"""
+    for f in fields:
+        field = model._meta.get_field(f)
+        if name in (field.name, field.column):
+            return field
+    raise BulkUpdateError(f'Field {name} cannot be updated')
+
+
+def _scalar(field, value, message):
+    # str() of an object or list would be stored as text by a CharField
+    if isinstance(value, (dict, list)):
+        raise BulkUpdateError(f'{message} {value!r} for {field.name}: expected a single value')
+
+
+def _clean(field, value):
+    _scalar(field, value, 'Invalid value')
+    try:
+        return field.clean(value, None)
+    except ValidationError as e:
+        raise BulkUpdateError(f'Invalid value {value!r} for {field.name}: {" ".join(e.messages)}')
+    except (TypeError, ValueError):
+        raise BulkUpdateError(f'Invalid value {value!r} for {field.name}')
+
+
+def parse_updates(resource, updates):
+    """Validate a list of updates of the form
+
+        {"key": <primary key>, "set": {<field>: <value>, ...}, "expect": {<field>: <value>, ...}}
+
+    where "expect" (optional) holds the values the row must currently have for the update to apply.
+    Returns (model, [(key, {field: value}, {field: value})]).
+
+    """
+    if resource not in RESOURCES:
+        raise BulkUpdateError(f'Unknown table {resource}')
+    model, fields = RESOURCES[resource]
+    pk = model._meta.pk
+    parsed = []
+    seen = set()
+    for update in updates:
+        if not isinstance(update, dict) or 'key' not in update or not update.get('set'):
+            raise BulkUpdateError('Each update requires a "key" and a non-empty "set"')
+        if not isinstance(update['set'], dict) or not isinstance(update.get('expect') or {}, dict):
+            raise BulkUpdateError('"set" and "expect" must be objects of field values')
+        try:
+            if isinstance(update['key'], (dict, list)):
+                raise TypeError
+            key = pk.to_python(update['key'])
+        except (ValidationError, TypeError, ValueError):
+            raise BulkUpdateError(f'Invalid key {update["key"]!r}')
+        if key in seen:
+            raise BulkUpdateError(f'Duplicate key {key!r}')
+        seen.add(key)
+        values = {}
+        for name, value in update['set'].items():
+            field = _field(model, fields, name)
+            values[field] = _clean(field, value)
+        expected = {}
+        for name, value in (update.get('expect') or {}).items():
+            field = _field(model, fields, name)
+            _scalar(field, value, 'Invalid expected value')
+            try:
+                expected[field] = None if value is None else field.to_python(value)
+            except (ValidationError, TypeError, ValueError):
+                raise BulkUpdateError(f'Invalid expected value {value!r} for {field.name}')
+        parsed.append((key, values, expected))
+    return model, parsed
+
+
+def _update_group(model, set_fields, expect_fields, rows):
+    """Apply rows that set and check the same fields with one UPDATE ... FROM (VALUES ...) statement.
+    Returns the keys of the rows that were updated.
+
+    """
+    qn = connection.ops.quote_name
+    pk = model._meta.pk
+    columns = ['key'] + [f's{i}' for i in range(len(set_fields))] + [f'e{i}' for i in range(len(expect_fields))]
+    placeholders = '(' + ', '.join(['%s'] * len(columns)) + ')'
+
+    params = []
+    for key, values, expected in rows:
+        params.append(pk.get_db_prep_value(key, connection))
+        params.extend(f.get_db_prep_value(values[f], connection) for f in set_fields)
+        params.extend(f.get_db_prep_value(expected[f], connection) for f in expect_fields)
+
+    assignments = ', '.join(f'{qn(f.column)} = v.s{i}::{f.db_type(connection)}' for i, f in enumerate(set_fields))
+    conditions = [f't.{qn(pk.column)} = v.key::{pk.db_type(connection)}']
+    conditions += [f't.{qn(f.column)} IS NOT DISTINCT FROM v.e{i}::{f.db_type(connection)}'
+                   for i, f in enumerate(expect_fields)]
+    sql = (f'UPDATE {qn(model._meta.db_table)} AS t SET {assignments} '
+           f'FROM (VALUES {", ".join([placeholders] * len(rows))}) AS v({", ".join(columns)}) '
+           f'WHERE {" AND ".join(conditions)} '
+           f'RETURNING t.{qn(pk.column)}')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [pk.to_python(r[0]) for r in cursor.fetchall()]
+
+
+def _lock(model, keys):
+    """Lock the existing rows of keys, in key order"""
+    qn = connection.ops.quote_name
+    pk = model._meta.pk
+    sql = (f'SELECT {qn(pk.column)} FROM {qn(model._meta.db_table)} '
+           f'WHERE {qn(pk.column)} = ANY(%s) ORDER BY {qn(pk.column)} FOR UPDATE')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [sorted(pk.get_db_prep_value(key, connection) for key in keys)])
+
+
+def bulk_update(model, updates):
+    """Apply parsed updates in one transaction, one statement per combination of set/expected fields.
+    Rows that no longer match their expected values (or do not exist) are returned as conflicts.
+    All rows are locked in key order first, and each statement updates its rows in key order,
+    so concurrent bulk updates of overlapping rows wait for each other instead of deadlocking.
+
+    """
+    groups = defaultdict(list)
+    for key, values, expected in updates:
+        set_fields = tuple(sorted(values, key=lambda f: f.name))
+        expect_fields = tuple(sorted(expected, key=lambda f: f.name))
+        groups[(set_fields, expect_fields)].append((key, values, expected))
+
+    updated = set()
+    with transaction.atomic():
+        _lock(model, [key for key, _, _ in updates])
+        for (set_fields, expect_fields), rows in groups.items():
+            rows.sort(key=lambda row: row[0])
+            updated.update(_update_group(model, set_fields, expect_fields, rows))
+    conflicts = [key for key, _, _ in updates if key not in updated]
+    return sorted(updated), conflicts
@@ -0,0 +1,50 @@
+from django.db import connection
+
+from .models import VALIDATED_STATE, PIPELINE_STATE, PIPELINE_VALIDATION_STATE
+
+
+# (title, table, state column, known states in display order)
+PANELS = (
+    ('Tiles - 3D pipeline validation', 'tile_state', '3d_pipeline_val', [s[0] for s in VALIDATED_STATE]),
+    ('Tiles - MFS', 'tile_state', 'mfs_state', []),
+    ('Tiles - cube', 'tile_state', 'cube_state', []),
+    ('Observations - MFS', 'observation_state', 'mfs_state', []),
+    ('Observations - cube', 'observation_state', 'cube_state', []),
+    ('Observations - 1D pipeline validation', 'observation_state', '1d_pipeline_validation',
+     [s[0] for s in PIPELINE_VALIDATION_STATE]),
+    ('Partial tiles - 1D pipeline', 'partial_tile_1d_pipeline', '1d_pipeline', [s[0] for s in PIPELINE_STATE]),
+)
+BANDS = (1, 2)
+
+
+def state_counts():
+    """Current number of rows per state, from the counters kept by db/state_counters.sql"""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT table_name, column_name, state, count FROM possum.state_count_total WHERE count <> 0')
+        counts = {(r[0], r[1], r[2]): r[3] for r in cursor.fetchall()}
+
+    panels = []
+    for title, table, column, known in PANELS:
+        states = list(known)
+        for t, c, state in counts:
+            if t.startswith(f'{table}_band') and c == column and state not in states:
+                states.append(state)
+        rows = []
+        for state in states:
+            values = [counts.get((f'{table}_band{band}', column, state), 0) for band in BANDS]
+            rows.append((state or '-', values))
+        totals = [sum(r[1][i] for r in rows) for i in range(len(BANDS))]
+        panels.append({'title': title, 'rows': rows, 'totals': totals})
+    return panels
+
+
+def state_history(days):
+    """Rows moved into each state per day over the last `days` days"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT day, table_name, column_name, state, transitions FROM possum.state_history_total '
+            'WHERE day > current_date - %s ORDER BY day DESC, table_name, column_name, state',
+            [days]
+        )
+        return [{'day': r[0], 'table': r[1], 'column': r[2], 'state': r[3] or '-', 'transitions': r[4]}
+                for r in cursor.fetchall()]
@@ -0,0 +1,146 @@
+import select
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+
+CHANNEL = 'state_change'
+
+# Open feed requests each hold a request thread for up to FEED_MAX_TIMEOUT (long poll) or
+# FEED_STREAM_MAX_AGE (stream) seconds, so only this many are served at a time per process.
+_slots = threading.BoundedSemaphore(settings.FEED_MAX_CONNECTIONS)
+
+
+class FeedBusy(Exception):
+    pass
+
+
+class FeedSlot:
+    """One of the FEED_MAX_CONNECTIONS open feed requests of this process, raises FeedBusy when
+    they are all in use. Released on exit, or when the stream() iterator is closed.
+    """
+    def __init__(self):
+        if not _slots.acquire(blocking=False):
+            raise FeedBusy()
+        self._lock = threading.Lock()
+        self._held = True
+
+    def release(self):
+        with self._lock:
+            if self._held:
+                self._held = False
+                _slots.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def stream(self, chunks):
+        return _SlotStream(self, chunks)
+
+
+class _SlotStream:
+    """Iterator over chunks that releases its slot when closed, even if it was never started"""
+    def __init__(self, slot, chunks):
+        self.slot = slot
+        self.chunks = chunks
+
+    def __iter__(self):
+        with self.slot:
+            yield from self.chunks
+
+    def close(self):
+        try:
+            self.chunks.close()
+        finally:
+            self.slot.release()
+
+
+def parse_cursor(cursor):
+    """Feed cursor "<xid>-<id>" of the last change seen, empty for the start of the feed"""
+    if not cursor:
+        return 0, 0
+    xid, change_id = cursor.split('-')
+    return int(xid), int(change_id)
+
+
+def format_cursor(xid, change_id):
+    return f'{xid}-{change_id}'
+
+
+def fetch_changes(cursor, limit, tables=None):
+    """Changes after the cursor, in (transaction, id) order, and the cursor to continue from.
+
+    Only changes of transactions older than the oldest transaction still in progress are returned,
+    so a change can never become visible behind a cursor that has already been handed out. A long
+    running or idle in transaction session therefore holds back the whole feed until it ends.
+    """
+    xid, change_id = cursor
+    with connection.cursor() as c:
+        c.execute('SELECT pg_snapshot_xmin(pg_current_snapshot())::text')
+        xmin = int(c.fetchone()[0])
+        sql = ('SELECT id, xid::text, changed_at, table_name, key, operation, data FROM possum.state_change '
+               'WHERE (xid, id) > (%s::text::xid8, %s) AND xid < %s::text::xid8')
+        params = [xid, change_id, xmin]
+        if tables:
+            sql += ' AND table_name = ANY(%s)'
+            params.append(list(tables))
+        sql += ' ORDER BY xid, id LIMIT %s'
+        params.append(limit)
+        c.execute(sql, params)
+        rows = c.fetchall()
+
+    changes = [{
+        'id': r[0],
+        'changed_at': r[2].isoformat(),
+        'table': r[3],
+        'key': r[4],
+        'operation': r[5],
+        'data': r[6],
+    } for r in rows]
+    if len(rows) < limit:
+        # Every change of a transaction before xmin has been returned
+        next_cursor = max((xid, change_id), (xmin, 0))
+    else:
+        next_cursor = (int(rows[-1][1]), rows[-1][0])
+    return changes, next_cursor
+
+
+def _listen(command):
+    with connection.cursor() as c:
+        c.execute(f'{command} {CHANNEL}')
+
+
+def _wait(timeout):
+    """Wait up to timeout seconds for a notification on the state change channel"""
+    conn = connection.connection
+    if select.select([conn], [], [], timeout) == ([], [], []):
+        return False
+    conn.poll()
+    conn.notifies.clear()
+    return True
+
+
+def poll_changes(cursor, limit, timeout, tables=None):
+    """Long poll: return as soon as there are changes after the cursor, or after timeout seconds.
+    Waits on LISTEN/NOTIFY, and re-checks every second for changes held back by transactions that
+    were still in progress.
+
+    """
+    deadline = time.monotonic() + timeout
+    connection.ensure_connection()
+    _listen('LISTEN')
+    try:
+        while True:
+            changes, next_cursor = fetch_changes(cursor, limit, tables)
+            remaining = deadline - time.monotonic()
+            if changes or remaining <= 0:
+                return changes, next_cursor
+            cursor = next_cursor
+            _wait(min(remaining, 1.0))
+    finally:
+        _listen('UNLISTEN')
@@ -0,0 +1,86 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from processing_states.models import PartialTilePipelineRegion
+from processing_states.regions import tile_graph, observation_regions, crosses_ra_zero
+from survey.models import AssociatedTile, Tile
+
+
+BOUNDARY_TYPE = '{} - crosses projection boundary!'
+
+
+class Command(BaseCommand):
+    help = ('Generate the partial tile regions (center, edge and corner) of every observation from the tile map '
+            'and insert the ones that do not exist yet')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--band', type=int, action='append', choices=(1, 2),
+                            help='Only observations of this band (repeatable, default: all bands)')
+        parser.add_argument('--observation', action='append', help='Only this observation (repeatable)')
+        parser.add_argument('--nside', type=int, default=32, help='HEALPix nside of the tile grid (RING ordering)')
+        parser.add_argument('--prune', action='store_true', default=False,
+                            help='Delete regions that are no longer in the tile map and have not been processed')
+        parser.add_argument('--dry-run', action='store_true', default=False, help='Only report the changes')
+
+    def handle(self, *args, **options):
+        try:
+            import healpy  # noqa: F401
+        except ImportError:
+            raise CommandError('Generating partial tiles requires healpy (pip install healpy)')
+
+        start = time.perf_counter()
+        tile_map = AssociatedTile.objects.filter(name__isnull=False, tile__isnull=False, name__band__isnull=False)
+        if options['band']:
+            tile_map = tile_map.filter(name__band__in=options['band'])
+        if options['observation']:
+            tile_map = tile_map.filter(name__in=options['observation'])
+        rows = list(tile_map.values_list('name', 'name__band', 'tile'))
+        if not rows:
+            raise CommandError('No tile map entries found')
+
+        names, obs_index = np.unique([r[0] for r in rows], return_inverse=True)
+        bands = dict((r[0], r[1]) for r in rows)
+        tiles, tile_index = np.unique(np.array([r[2] for r in rows], dtype=np.int64), return_inverse=True)
+        membership = np.zeros((len(names), len(tiles)), dtype=bool)
+        membership[obs_index, tile_index] = True
+        ra = dict(Tile.objects.filter(tile__in=tiles.tolist()).values_list('tile', 'ra_deg'))
+
+        edges, corners = tile_graph(tiles, options['nside'])
+        generated = {}
+        for obs, region, kind in observation_regions(membership, tiles, edges, corners):
+            region = tuple(int(t) for t in region)
+            region_ra = [ra[t] for t in region if ra.get(t) is not None]
+            if kind != 'center' and crosses_ra_zero(region_ra):
+                kind = BOUNDARY_TYPE.format(kind)
+            generated[(str(names[obs]), region)] = kind
+        self.stdout.write(f'{len(generated)} regions for {len(names)} observations ({time.perf_counter() - start:.2f}s)')
+
+        existing = {}
+        for pk, band, name, *region_tiles, state in PartialTilePipelineRegion.objects.filter(
+                observation__in=names.tolist()).values_list(
+                'id', 'band', 'observation', 'tile1', 'tile2', 'tile3', 'tile4', '_1d_pipeline'):
+            existing[(name, tuple(sorted(t for t in region_tiles if t is not None)))] = (pk, band, state)
+
+        new = [
+            PartialTilePipelineRegion(band=bands[name], observation_id=name, type=kind,
+                                      **{f'tile{i + 1}_id': t for i, t in enumerate(region)})
+            for (name, region), kind in generated.items() if (name, region) not in existing
+        ]
+        stale = [(pk, band) for key, (pk, band, state) in existing.items() if key not in generated and state is None]
+        self.stdout.write(f'{len(new)} new regions, {len(existing) - len(generated) + len(new)} existing regions '
+                          f'not in the tile map ({len(stale)} unprocessed)')
+        if options['dry_run']:
+            return
+
+        with transaction.atomic():
+            PartialTilePipelineRegion.objects.bulk_create(new, batch_size=5000)
+            deleted = 0
+            if options['prune']:
+                for band in {band for _, band in stale}:
+                    ids = [pk for pk, b in stale if b == band]
+                    deleted += PartialTilePipelineRegion.objects.filter(
+                        band=band, id__in=ids, _1d_pipeline__isnull=True).delete()[0]
+        self.stdout.write(f'Inserted {len(new)} and deleted {deleted} regions ({time.perf_counter() - start:.2f}s)')
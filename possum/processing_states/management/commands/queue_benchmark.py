@@ -0,0 +1,85 @@
+import socket
+import threading
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from processing_states import queue
+from processing_states.models import PartialTilePipelineRegion
+
+
+BENCHMARK_BAND = 0
+BENCHMARK_TABLE = f'{PartialTilePipelineRegion._meta.db_table}_benchmark'
+
+
+class Command(BaseCommand):
+    help = ('Measure 1D pipeline work queue throughput with concurrent workers. Runs against a standalone '
+            'scratch table with the columns of partial_tile_1d_pipeline that is created and dropped by the '
+            'benchmark; the partial tile tables, their triggers and counters are not touched.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--regions', type=int, default=10000, help='Number of regions to queue')
+        parser.add_argument('--workers', type=int, default=8, help='Number of concurrent workers (threads)')
+        parser.add_argument('--batch', type=int, default=10, help='Regions claimed per request')
+        parser.add_argument('--lease', type=int, default=60, help='Lease duration in seconds')
+
+    def handle(self, *args, **options):
+        if min(options['regions'], options['workers'], options['batch'], options['lease']) <= 0:
+            raise CommandError('All options must be positive')
+        qn = connection.ops.quote_name
+        source = qn(PartialTilePipelineRegion._meta.db_table)
+        table = qn(BENCHMARK_TABLE)
+
+        # Not a partition: writes to the scratch table fire none of the state table triggers.
+        # Fails if the table exists, e.g. while another benchmark is running.
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'CREATE UNLOGGED TABLE {table} (LIKE {source})')
+            cursor.execute(f'CREATE INDEX ON {table} (band, id) WHERE "1d_pipeline" IS NULL')
+            cursor.execute(f'CREATE INDEX ON {table} (band, lease_expires) WHERE "1d_pipeline" = %s', [queue.RUNNING])
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(f'INSERT INTO {table} (id, band, observation, tile1, type, attempts) '
+                               f'SELECT n, %s, %s, 0, %s, 0 FROM generate_series(1, %s) n',
+                               [BENCHMARK_BAND, 'benchmark', 'center', options['regions']])
+            claimed, elapsed, requests = self.run_workers(options)
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE {table}')
+
+        duplicates = sum(1 for n in claimed.values() if n > 1)
+        self.stdout.write(f'{sum(claimed.values())} regions claimed and completed by {options["workers"]} workers '
+                          f'in {elapsed:.2f}s ({sum(claimed.values()) / max(elapsed, 1e-9):.0f} regions/s, '
+                          f'{requests / max(elapsed, 1e-9):.0f} claim requests/s)')
+        if duplicates or len(claimed) != options['regions']:
+            raise CommandError(f'{duplicates} regions were claimed more than once, '
+                               f'{options["regions"] - len(claimed)} were never claimed')
+        self.stdout.write('Every region was claimed exactly once')
+
+    def run_workers(self, options):
+        claimed = Counter()
+        requests = Counter()
+        lock = threading.Lock()
+
+        def worker(n):
+            name = f'{socket.gethostname()}-benchmark-{n}'
+            try:
+                while True:
+                    regions = queue.claim(BENCHMARK_BAND, name, options['batch'], options['lease'], BENCHMARK_TABLE)
+                    requests[n] += 1
+                    if not regions:
+                        return
+                    queue.complete(BENCHMARK_BAND, name, {r['id']: 'Completed' for r in regions}, BENCHMARK_TABLE)
+                    with lock:
+                        claimed.update(r['id'] for r in regions)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(options['workers'])]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return claimed, time.perf_counter() - start, sum(requests.values())
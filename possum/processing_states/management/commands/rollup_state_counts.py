@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+
+class Command(BaseCommand):
+    help = ('Fold the state count deltas written by the state table triggers into the dashboard counters '
+            '(db/state_counters.sql). Run it periodically, e.g. every few minutes from cron.')
+
+    def handle(self, *args, **options):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM possum.state_count_delta')
+            pending = cursor.fetchone()[0]
+            cursor.execute('SELECT possum.rollup_state_counts()')
+        self.stdout.write(f'Rolled up {pending} state count deltas')
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+
+class Command(BaseCommand):
+    help = ('Delete state changes older than FEED_RETENTION days from the change feed log '
+            '(db/state_change_feed.sql). Run it periodically, e.g. daily from cron.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.FEED_RETENTION,
+                            help='Keep this many days of changes (default FEED_RETENTION)')
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Rows deleted per transaction')
+
+    def handle(self, *args, **options):
+        deleted = 0
+        while True:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute('DELETE FROM possum.state_change WHERE id IN ('
+                               'SELECT id FROM possum.state_change '
+                               'WHERE changed_at < now() - make_interval(days => %s) LIMIT %s)',
+                               [options['days'], options['batch_size']])
+                count = cursor.rowcount
+            deleted += count
+            if count < options['batch_size']:
+                break
+        self.stdout.write(f'Deleted {deleted} state changes older than {options["days"]} days')
@@ -36,6 +36,7 @@ class PartialTilePipelineRegionsBand1(models.Model):
     type = models.CharField(choices=PARTIAL_TILES_TYPE, db_column='type')
     number_sources = models.PositiveIntegerField(blank=True, null=True, db_column='number_sources')
     _1d_pipeline = models.CharField(choices=PIPELINE_STATE, db_column='1d_pipeline', blank=True, null=True)
+    state_rank = models.SmallIntegerField(blank=True, null=True, editable=False)  # set by trigger (db/state_rank.sql)
 
     @property
     def sbid(self):
@@ -57,6 +58,7 @@ class PartialTilePipelineRegionsBand2(models.Model):
     type = models.CharField(choices=PARTIAL_TILES_TYPE, db_column='type')
     number_sources = models.PositiveIntegerField(blank=True, null=True, db_column='number_sources')
     _1d_pipeline = models.CharField(choices=PIPELINE_STATE, db_column='1d_pipeline', blank=True, null=True)
+    state_rank = models.SmallIntegerField(blank=True, null=True, editable=False)  # set by trigger (db/state_rank.sql)
 
     @property
     def sbid(self):
@@ -77,6 +79,7 @@ class ObservationStatesBand1(models.Model):
     mfs_state = models.TextField(blank=True, null=True)
     cube_update = models.DateTimeField(blank=True, null=True)
     cube_state = models.TextField(blank=True, null=True)
+    state_rank = models.SmallIntegerField(blank=True, null=True, editable=False)  # set by trigger (db/state_rank.sql)
 
     class Meta:
         verbose_name = "Band 1 - Observation State"
@@ -92,6 +95,7 @@ class ObservationStatesBand2(models.Model):
     mfs_state = models.TextField(blank=True, null=True)
     cube_update = models.DateTimeField(blank=True, null=True)
     cube_state = models.TextField(blank=True, null=True)
+    state_rank = models.SmallIntegerField(blank=True, null=True, editable=False)  # set by trigger (db/state_rank.sql)
 
     class Meta:
         verbose_name = "Band 2 - Observation State"
@@ -108,6 +112,7 @@ class TileStatesBand1(models.Model):
     _3d_val_comments = models.TextField(blank=True, null=True, db_column='3d_val_comments')
     cube_state = models.TextField(blank=True, null=True)
     mfs_state = models.TextField(blank=True, null=True)
+    state_rank = models.SmallIntegerField(blank=True, null=True, editable=False)  # set by trigger (db/state_rank.sql)
     class Meta:
         verbose_name = "Band 1 - Tile State"
         managed = False
@@ -115,7 +120,7 @@ class TileStatesBand1(models.Model):
 
 class TileStatesBand2(models.Model):
     tile = models.OneToOneField('survey.Tile', models.DO_NOTHING, db_column='tile', to_field='tile', primary_key=True)
-    _3d_pipeline = models.CharField(blank=True, null=True, db_column='3d_pipeline')
+    _3d_pipeline = models.DateTimeField(blank=True, null=True, db_column='3d_pipeline')
     _3d_pipeline_val = models.CharField( blank=True, null=True, choices=VALIDATED_STATE, db_column='3d_pipeline_val')
     _3d_pipeline_ingest = models.CharField(blank=True, null=True, db_column='3d_pipeline_ingest')
     _3d_pipeline_validator = models.CharField(blank=True, null=True, db_column='3d_pipeline_validator')
@@ -123,7 +128,67 @@ class TileStatesBand2(models.Model):
     _3d_val_comments = models.TextField(blank=True, null=True, db_column='3d_val_comments')
     cube_state = models.TextField(blank=True, null=True)
     mfs_state = models.TextField(blank=True, null=True)
+    state_rank = models.SmallIntegerField(blank=True, null=True, editable=False)  # set by trigger (db/state_rank.sql)
     class Meta:
         verbose_name = "Band 2 - Tile State"
         managed = False
         db_table = 'tile_state_band2'
+
+
+# All bands at once: the band-partitioned parent tables of the per-band tables above (db/band_partitions.sql).
+# Filter on band to only read one partition. Django needs a single column primary key: except for
+# observation names, the key is only unique within a band, so use filter() rather than get() by pk.
+# For the same reason they are not registered in the admin, whose change views look rows up by pk.
+
+class PartialTilePipelineRegion(models.Model):
+    id = models.BigAutoField(primary_key=True, db_column='id')
+    band = models.SmallIntegerField()
+    observation = models.ForeignKey('survey.Observation', models.CASCADE, db_column='observation', related_name='partial_tile_regions')
+    tile1 = models.ForeignKey('survey.Tile', models.DO_NOTHING, db_column='tile1', related_name='regions_tile1')
+    tile2 = models.ForeignKey('survey.Tile', models.DO_NOTHING, blank=True, null=True, db_column='tile2', related_name='regions_tile2')
+    tile3 = models.ForeignKey('survey.Tile', models.DO_NOTHING, blank=True, null=True, db_column='tile3', related_name='regions_tile3')
+    tile4 = models.ForeignKey('survey.Tile', models.DO_NOTHING, blank=True, null=True, db_column='tile4', related_name='regions_tile4')
+    type = models.CharField(choices=PARTIAL_TILES_TYPE, db_column='type')
+    number_sources = models.PositiveIntegerField(blank=True, null=True, db_column='number_sources')
+    _1d_pipeline = models.CharField(choices=PIPELINE_STATE, db_column='1d_pipeline', blank=True, null=True)
+    state_rank = models.SmallIntegerField(blank=True, null=True, editable=False)  # set by trigger (db/state_rank.sql)
+
+    class Meta:
+        verbose_name = "Partial Tile 1D Pipeline"
+        managed = False
+        db_table = 'partial_tile_1d_pipeline'
+
+class ObservationState(models.Model):
+    name = models.OneToOneField('survey.Observation', models.CASCADE, db_column='name', to_field='name', primary_key=True, related_name='state')
+    band = models.SmallIntegerField()
+    _1d_pipeline_validation = models.CharField(blank=True, null=True, db_column='1d_pipeline_validation', choices=PIPELINE_VALIDATION_STATE)
+    single_SB_1D_pipeline = models.CharField(blank=True, null=True, db_column='single_sb_1d_pipeline')
+    comments = models.TextField(blank=True, null=True, db_column='comments')
+    mfs_update = models.DateTimeField(blank=True, null=True)
+    mfs_state = models.TextField(blank=True, null=True)
+    cube_update = models.DateTimeField(blank=True, null=True)
+    cube_state = models.TextField(blank=True, null=True)
+    state_rank = models.SmallIntegerField(blank=True, null=True, editable=False)  # set by trigger (db/state_rank.sql)
+
+    class Meta:
+        verbose_name = "Observation State"
+        managed = False
+        db_table = 'observation_state'
+
+class TileState(models.Model):
+    # One row per tile and band: the one-to-one is per partition, there is no unique constraint on tile
+    tile = models.OneToOneField('survey.Tile', models.DO_NOTHING, db_column='tile', to_field='tile', primary_key=True, db_constraint=False, related_name='+')
+    band = models.SmallIntegerField()
+    _3d_pipeline = models.DateTimeField(blank=True, null=True, db_column='3d_pipeline')
+    _3d_pipeline_val = models.CharField( blank=True, null=True, choices=VALIDATED_STATE, db_column='3d_pipeline_val')
+    _3d_pipeline_ingest = models.CharField(blank=True, null=True, db_column='3d_pipeline_ingest')
+    _3d_pipeline_validator = models.CharField(blank=True, null=True, db_column='3d_pipeline_validator')
+    _3d_val_link = models.CharField(blank=True, null=True, db_column='3d_val_link')
+    _3d_val_comments = models.TextField(blank=True, null=True, db_column='3d_val_comments')
+    cube_state = models.TextField(blank=True, null=True)
+    mfs_state = models.TextField(blank=True, null=True)
+    state_rank = models.SmallIntegerField(blank=True, null=True, editable=False)  # set by trigger (db/state_rank.sql)
+    class Meta:
+        verbose_name = "Tile State"
+        managed = False
+        db_table = 'tile_state'
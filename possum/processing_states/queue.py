@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import PartialTilePipelineRegion
+
+
+RUNNING = 'Running'
+FAILED = 'Failed'
+FINAL_STATES = ('Completed', FAILED)
+
+REGION_COLUMNS = ('id', 'band', 'observation', 'tile1', 'tile2', 'tile3', 'tile4', 'type', 'number_sources',
+                  'attempts', 'lease_expires')
+
+
+def _table(table=None):
+    """The partial tile table, or another table with the same columns (queue_benchmark, tests)"""
+    return connection.ops.quote_name(table or PartialTilePipelineRegion._meta.db_table)
+
+
+def claim(band, worker, limit, lease_seconds, table=None):
+    """Lease up to `limit` regions of a band to a worker.
+
+    Pending regions, and running regions whose lease has expired, are locked with
+    FOR UPDATE SKIP LOCKED: concurrent claims skip each other's rows instead of waiting,
+    so no region is handed to two workers. Claimed regions are set to Running.
+    Regions that have been claimed QUEUE_MAX_ATTEMPTS times are not claimed again; if their
+    last lease expired (the worker never reported back) they are set to Failed.
+    Returns the claimed regions, oldest first.
+
+    """
+    returning = ', '.join(f't.{connection.ops.quote_name(c)}' for c in REGION_COLUMNS)
+    fail_sql = (f'UPDATE {_table(table)} SET "1d_pipeline" = %s, lease_owner = NULL, lease_expires = NULL '
+                f'WHERE band = %s AND "1d_pipeline" = %s AND lease_expires < now() AND attempts >= %s')
+    sql = (f'WITH candidates AS ('
+           f'SELECT id FROM {_table(table)} '
+           f'WHERE band = %s AND ("1d_pipeline" IS NULL OR ("1d_pipeline" = %s AND lease_expires < now())) '
+           f'AND attempts < %s '
+           f'ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED) '
+           f'UPDATE {_table(table)} AS t SET "1d_pipeline" = %s, lease_owner = %s, '
+           f'lease_expires = now() + make_interval(secs => %s), attempts = t.attempts + 1 '
+           f'FROM candidates c WHERE t.band = %s AND t.id = c.id '
+           f'RETURNING {returning}')
+    max_attempts = settings.QUEUE_MAX_ATTEMPTS
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(fail_sql, [FAILED, band, RUNNING, max_attempts])
+        cursor.execute(sql, [band, RUNNING, max_attempts, limit, RUNNING, worker, lease_seconds, band])
+        rows = [dict(zip(REGION_COLUMNS, row)) for row in cursor.fetchall()]
+    return sorted(rows, key=lambda r: r['id'])
+
+
+def heartbeat(band, worker, ids, lease_seconds, table=None):
+    """Extend the leases a worker still holds. Returns the ids whose lease was extended."""
+    sql = (f'UPDATE {_table(table)} SET lease_expires = now() + make_interval(secs => %s) '
+           f'WHERE band = %s AND id = ANY(%s) AND "1d_pipeline" = %s AND lease_owner = %s '
+           f'RETURNING id')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [lease_seconds, band, list(ids), RUNNING, worker])
+        return sorted(row[0] for row in cursor.fetchall())
+
+
+def complete(band, worker, results, table=None):
+    """Record the outcome of leased regions, given as {id: state}.
+
+    The state is Completed or Failed, or None to release the region back to pending. Only
+    regions still leased by the worker are changed, so a worker whose lease expired and was
+    claimed by another worker cannot overwrite the other worker's result.
+    Returns the ids that were changed.
+
+    """
+    if not results:
+        return []
+    values = ', '.join(['(%s::bigint, %s::text)'] * len(results))
+    params = [v for item in results.items() for v in item]
+    sql = (f'UPDATE {_table(table)} AS t SET "1d_pipeline" = v.state, lease_owner = NULL, lease_expires = NULL '
+           f'FROM (VALUES {values}) AS v (id, state) '
+           f'WHERE t.band = %s AND t.id = v.id AND t."1d_pipeline" = %s AND t.lease_owner = %s '
+           f'RETURNING t.id')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + [band, RUNNING, worker])
+        return sorted(row[0] for row in cursor.fetchall())
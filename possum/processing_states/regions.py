@@ -0,0 +1,79 @@
+import numpy as np
+
+
+# healpy.get_all_neighbours order
+SW, W, NW, N, NE, E, SE, S = range(8)
+EDGE_NEIGHBOURS = (SW, NW, NE, SE)
+# Neighbours around each of the four vertices of a pixel (N, E, S and W vertex)
+VERTEX_NEIGHBOURS = ((NW, N, NE), (NE, E, SE), (SE, S, SW), (SW, W, NW))
+
+CHUNK_SIZE = 256
+
+
+def tile_graph(tiles, nside):
+    """Edges and corners of the HEALPix (RING) tile grid around the given tiles.
+
+    Tiles that share an edge are diagonal neighbours on the pixel grid; the pixels around a
+    vertex are a tile with three of its neighbours (two at the 8 vertices where only three
+    pixels meet). Returns (edges, corners): arrays of sorted tile ids, shape (n, 2) and (m, 4),
+    with -1 padding for three-tile corners.
+
+    """
+    import healpy
+
+    tiles = np.asarray(tiles, dtype=np.int64)
+    neighbours = healpy.get_all_neighbours(nside, tiles).astype(np.int64)
+
+    edges = np.concatenate([np.stack([tiles, neighbours[d]], axis=1) for d in EDGE_NEIGHBOURS])
+    edges = np.unique(np.sort(edges[(edges >= 0).all(axis=1)], axis=1), axis=0)
+
+    corners = np.concatenate([np.stack([tiles] + [neighbours[d] for d in vertex], axis=1)
+                              for vertex in VERTEX_NEIGHBOURS])
+    corners = np.unique(np.sort(corners, axis=1), axis=0)
+    return edges, corners
+
+
+def crosses_ra_zero(ra):
+    """Whether a region with tiles at these RAs (degrees) straddles RA 0.
+
+    The shortest RA range that covers all tiles leaves out the largest gap between neighbouring
+    RAs. The region straddles RA 0 when that gap is not the one across RA 0, so regions close to a
+    pole, which span a wide RA range without passing through RA 0, are not counted.
+
+    """
+    ra = np.sort(np.mod(np.asarray(ra, dtype=float), 360))
+    if len(ra) < 2:
+        return False
+    return bool(np.diff(ra).max() > 360 - ra[-1] + ra[0])
+
+
+def _index(tiles, ids):
+    """Column of each tile id in the membership matrix (len(tiles) for unknown ids and -1)"""
+    pos = np.clip(np.searchsorted(tiles, ids), 0, len(tiles) - 1)
+    return np.where((ids >= 0) & (tiles[pos] == ids), pos, len(tiles))
+
+
+def observation_regions(membership, tiles, edges, corners):
+    """Partial tile regions of each observation.
+
+    membership is a boolean (observations x tiles) matrix of the tile map, with tiles sorted.
+    A region is a tile of the observation (center), two edge-adjacent tiles that are both in the
+    observation (edge), or three or four tiles of the observation around a vertex (corner).
+    Yields (observation index, tuple of tile ids, kind).
+
+    """
+    tiles = np.asarray(tiles, dtype=np.int64)
+    # Extra all-False column for tiles outside the tile map
+    membership = np.hstack([membership, np.zeros((membership.shape[0], 1), dtype=bool)])
+    edge_index = _index(tiles, edges)
+    corner_index = _index(tiles, corners)
+
+    for start in range(0, membership.shape[0], CHUNK_SIZE):
+        chunk = membership[start:start + CHUNK_SIZE]
+        for obs, t in zip(*np.nonzero(chunk[:, :-1])):
+            yield start + obs, (tiles[t],), 'center'
+        for obs, e in zip(*np.nonzero(chunk[:, edge_index].all(axis=2))):
+            yield start + obs, tuple(edges[e]), 'edge'
+        present = chunk[:, corner_index]
+        for obs, c in zip(*np.nonzero(present.sum(axis=2) >= 3)):
+            yield start + obs, tuple(corners[c][present[obs, c]]), 'corner'
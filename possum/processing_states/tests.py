@@ -1,3 +1,198 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from . import queue
+from .api import BulkUpdateError, bulk_update, parse_updates
+from .regions import crosses_ra_zero, observation_regions, tile_graph
+
+
+class ParseUpdatesTests(SimpleTestCase):
+    def parse(self, *updates, resource='observation_state_band1'):
+        return parse_updates(resource, list(updates))
+
+    def test_parsed(self):
+        model, parsed = self.parse({'key': '1412-28', 'set': {'mfs_state': 'Complete'}, 'expect': {'mfs_state': None}})
+        self.assertEqual(model._meta.db_table, 'observation_state_band1')
+        (key, values, expected), = parsed
+        self.assertEqual(key, '1412-28')
+        self.assertEqual({f.name: v for f, v in values.items()}, {'mfs_state': 'Complete'})
+        self.assertEqual({f.name: v for f, v in expected.items()}, {'mfs_state': None})
+
+    def test_unknown_table(self):
+        with self.assertRaises(BulkUpdateError):
+            self.parse({'key': '1412-28', 'set': {'mfs_state': 'Complete'}}, resource='observation')
+
+    def test_field_not_updatable(self):
+        with self.assertRaises(BulkUpdateError):
+            self.parse({'key': '1412-28', 'set': {'state_rank': 1}})
+
+    def test_invalid_value(self):
+        with self.assertRaises(BulkUpdateError):
+            self.parse({'key': '1412-28', 'set': {'mfs_update': 'yesterday'}})
+
+    def test_wrong_value_type(self):
+        for value in (12, {'state': 'Complete'}, ['Complete']):
+            with self.subTest(value=value), self.assertRaises(BulkUpdateError):
+                self.parse({'key': '1412-28', 'set': {'mfs_update': value}})
+        for value in ({'state': 'Complete'}, ['Complete']):
+            with self.subTest(value=value), self.assertRaises(BulkUpdateError):
+                self.parse({'key': '1412-28', 'set': {'mfs_state': value}})
+
+    def test_invalid_expected_value(self):
+        for value in (12, 'yesterday', {'at': 'now'}):
+            with self.subTest(value=value), self.assertRaises(BulkUpdateError):
+                self.parse({'key': '1412-28', 'set': {'mfs_state': 'Complete'}, 'expect': {'mfs_update': value}})
+
+    def test_invalid_key(self):
+        for key in ('abc', {'tile': 1}, [1]):
+            with self.subTest(key=key), self.assertRaises(BulkUpdateError):
+                self.parse({'key': key, 'set': {'mfs_state': 'Complete'}}, resource='tile_state_band1')
+
+    def test_duplicate_key(self):
+        with self.assertRaises(BulkUpdateError):
+            self.parse({'key': 1, 'set': {'mfs_state': 'Complete'}},
+                       {'key': '1', 'set': {'cube_state': 'Complete'}}, resource='tile_state_band1')
+
+    def test_missing_set(self):
+        for update in ({'key': '1412-28'}, {'key': '1412-28', 'set': {}}, {'set': {'mfs_state': 'Complete'}}, '1412-28'):
+            with self.subTest(update=update), self.assertRaises(BulkUpdateError):
+                self.parse(update)
+
+
+class BulkUpdateTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch('processing_states.api.transaction')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_updates(self, updates, returned):
+        model, parsed = parse_updates('tile_state_band1', updates)
+        with mock.patch('processing_states.api.connection.cursor') as cursor_factory:
+            cursor = cursor_factory.return_value.__enter__.return_value
+            cursor.fetchall.side_effect = returned
+            result = bulk_update(model, parsed)
+        return result, [c.args for c in cursor.execute.call_args_list]
+
+    def test_rows_locked_in_key_order(self):
+        updates = [{'key': 3, 'set': {'mfs_state': 'Complete'}},
+                   {'key': 1, 'set': {'cube_state': 'Complete'}},
+                   {'key': 2, 'set': {'mfs_state': 'Complete'}}]
+        (updated, conflicts), statements = self.run_updates(updates, [[(2,), (3,)], [(1,)]])
+        (lock, params), *changes = statements
+        self.assertIn('ORDER BY "tile" FOR UPDATE', lock)
+        self.assertEqual(params, [[1, 2, 3]])
+        self.assertEqual(len(changes), 2)
+        self.assertEqual(changes[0][1][::2], [2, 3])
+        self.assertEqual((updated, conflicts), ([1, 2, 3], []))
+
+    def test_expect_conflicts_reported(self):
+        updates = [{'key': 1, 'set': {'mfs_state': 'Complete'}, 'expect': {'mfs_state': 'Running'}},
+                   {'key': 2, 'set': {'mfs_state': 'Complete'}, 'expect': {'mfs_state': 'Running'}}]
+        (updated, conflicts), statements = self.run_updates(updates, [[(2,)]])
+        self.assertIn('IS NOT DISTINCT FROM', statements[1][0])
+        self.assertEqual(statements[1][1], [1, 'Complete', 'Running', 2, 'Complete', 'Running'])
+        self.assertEqual((updated, conflicts), ([2], [1]))
+
+
+QUEUE_TABLE = 'queue_test_regions'
+
+
+@override_settings(QUEUE_MAX_ATTEMPTS=2)
+class QueueTests(TestCase):
+    """claim, heartbeat and complete against a scratch table with the partial tile queue columns"""
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'CREATE TABLE {QUEUE_TABLE} (id bigint, band smallint, observation text, '
+                           f'tile1 bigint, tile2 bigint, tile3 bigint, tile4 bigint, type text, '
+                           f'number_sources integer, "1d_pipeline" text, lease_owner text, '
+                           f'lease_expires timestamp with time zone, attempts integer NOT NULL DEFAULT 0)')
+            cursor.execute(f"INSERT INTO {QUEUE_TABLE} (id, band, observation, tile1, type) "
+                           f"SELECT n, 1, 'obs', n, 'center' FROM generate_series(1, 3) n")
+
+    def claim(self, worker, limit=10):
+        return [r['id'] for r in queue.claim(1, worker, limit, 60, QUEUE_TABLE)]
+
+    def expire(self, *ids):
+        with connection.cursor() as cursor:
+            cursor.execute(f"UPDATE {QUEUE_TABLE} SET lease_expires = now() - interval '1 second' "
+                           f"WHERE id = ANY(%s)", [list(ids)])
+
+    def state(self, region):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT "1d_pipeline", lease_owner, attempts FROM {QUEUE_TABLE} WHERE id = %s',
+                           [region])
+            return cursor.fetchone()
+
+    def test_claimed_once(self):
+        self.assertEqual(self.claim('a', limit=2), [1, 2])
+        self.assertEqual(self.claim('b'), [3])
+        self.assertEqual(self.claim('c'), [])
+        self.assertEqual(self.state(1), ('Running', 'a', 1))
+
+    def test_expired_lease_reclaimed(self):
+        self.claim('a')
+        self.expire(2)
+        self.assertEqual(self.claim('b'), [2])
+        self.assertEqual(self.state(2), ('Running', 'b', 2))
+        # The first worker lost the lease: it can neither extend it nor record a result
+        self.assertEqual(queue.heartbeat(1, 'a', [1, 2], 60, QUEUE_TABLE), [1])
+        self.assertEqual(queue.complete(1, 'a', {1: 'Completed', 2: 'Failed'}, QUEUE_TABLE), [1])
+        self.assertEqual(self.state(1), ('Completed', None, 1))
+        self.assertEqual(self.state(2), ('Running', 'b', 2))
+
+    def test_heartbeat_extends_own_leases(self):
+        self.claim('a', limit=1)
+        self.assertEqual(queue.heartbeat(1, 'b', [1], 60, QUEUE_TABLE), [])
+        self.expire(1)
+        self.assertEqual(queue.heartbeat(1, 'a', [1], 60, QUEUE_TABLE), [1])
+        self.assertEqual(self.claim('b'), [2, 3])
+
+    def test_released_region_claimed_again(self):
+        self.claim('a', limit=1)
+        self.assertEqual(queue.complete(1, 'a', {1: None}, QUEUE_TABLE), [1])
+        self.assertEqual(self.state(1), (None, None, 1))
+        self.assertEqual(self.claim('b', limit=1), [1])
+
+    def test_failed_after_max_attempts(self):
+        self.claim('a', limit=1)
+        self.expire(1)
+        self.assertEqual(self.claim('b', limit=1), [1])
+        self.expire(1)
+        self.assertEqual(self.claim('c', limit=1), [2])
+        self.assertEqual(self.state(1), ('Failed', None, 2))
+
+
+class RegionTests(SimpleTestCase):
+    # nside 1, RING: pixel 0 has neighbours SW 4, NW 3, N 2, NE 1, SE 5, S 8 and none to the W and E,
+    # where only three pixels meet at its vertices
+    def test_tile_graph(self):
+        edges, corners = tile_graph([0], 1)
+        self.assertEqual(edges.tolist(), [[0, 1], [0, 3], [0, 4], [0, 5]])
+        self.assertEqual(corners.tolist(), [[-1, 0, 1, 5], [-1, 0, 3, 4], [0, 1, 2, 3], [0, 4, 5, 8]])
+
+    def test_observation_regions(self):
+        tiles = [0, 1, 5]
+        edges, corners = tile_graph(tiles, 1)
+        membership = np.array([[True, True, True], [True, False, False]])
+        regions = sorted((int(obs), tuple(int(t) for t in region), kind)
+                         for obs, region, kind in observation_regions(membership, tiles, edges, corners))
+        self.assertEqual(regions, [
+            (0, (0,), 'center'), (0, (0, 1), 'edge'), (0, (0, 1, 5), 'corner'), (0, (0, 5), 'edge'),
+            (0, (1,), 'center'), (0, (1, 5), 'edge'), (0, (5,), 'center'),
+            (1, (0,), 'center'),
+        ])
+
+    def test_crosses_ra_zero(self):
+        self.assertTrue(crosses_ra_zero([355, 5]))
+        self.assertTrue(crosses_ra_zero([0, 350]))
+        self.assertTrue(crosses_ra_zero([-5, 5]))
+        self.assertFalse(crosses_ra_zero([10, 20]))
+        self.assertFalse(crosses_ra_zero([360, 10]))
+        self.assertFalse(crosses_ra_zero([5]))
+
+    def test_pole_region_does_not_cross_ra_zero(self):
+        self.assertFalse(crosses_ra_zero([45, 135, 225, 315]))
+        self.assertTrue(crosses_ra_zero([315, 45, 100]))
@@ -0,0 +1,12 @@
+from django.urls import path
+
+from . import views
+
+urlpatterns = [
+    path('states/<str:table>/', views.bulk_state_update, name='bulk_state_update'),
+    path('changes/', views.state_changes, name='state_changes'),
+    path('changes/stream/', views.state_change_stream, name='state_change_stream'),
+    path('queue/<int:band>/claim/', views.queue_claim, name='queue_claim'),
+    path('queue/<int:band>/heartbeat/', views.queue_heartbeat, name='queue_heartbeat'),
+    path('queue/<int:band>/complete/', views.queue_complete, name='queue_complete'),
+]
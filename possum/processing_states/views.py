@@ -1,11 +1,229 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import logout
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET, require_POST
+import json
+import time
 import urllib.parse
 
+from survey.decorators import api_auth_required, change_permission
+from survey.streaming import streaming_response
+from .api import RESOURCES, BulkUpdateError, parse_updates, bulk_update
+from .feed import FeedBusy, FeedSlot, parse_cursor, format_cursor, poll_changes
+from .dashboard import BANDS, state_counts, state_history
+from . import queue
+from .models import PartialTilePipelineRegion, PartialTilePipelineRegionsBand1, PartialTilePipelineRegionsBand2
+
 
 def logout_view(request):
   logout(request)
   url = settings.LOGOUT_URL + '?redirect_uri=' + urllib.parse.quote(f"https://{request.get_host()}/admin")
-  return redirect(url)
\ No newline at end of file
+  return redirect(url)
+
+
+def _table_permissions(request, table):
+  return [change_permission(RESOURCES[table][0])] if table in RESOURCES else None
+
+
+QUEUE_MODELS = {1: PartialTilePipelineRegionsBand1, 2: PartialTilePipelineRegionsBand2}
+
+
+def _queue_permissions(request, band):
+  return [change_permission(QUEUE_MODELS.get(band, PartialTilePipelineRegion))]
+
+
+@require_POST
+@api_auth_required(permissions=_table_permissions)
+def bulk_state_update(request, table):
+  """Apply a batch of state updates to a state table, e.g. POST /api/states/tile_state_band1/
+
+  {"updates": [{"key": 5184, "set": {"cube_state": "COMPLETED"}, "expect": {"cube_state": "RUNNING"}}, ...]}
+
+  Updates whose "expect" values no longer match (or whose key does not exist) are not applied and
+  are returned in "conflicts".
+  """
+  try:
+    body = json.loads(request.body)
+    updates = body['updates']
+  except (ValueError, KeyError, TypeError):
+    return JsonResponse({'error': 'Expected a JSON object with a list of "updates"'}, status=400)
+  if not isinstance(updates, list):
+    return JsonResponse({'error': '"updates" must be a list'}, status=400)
+  if len(updates) > settings.API_MAX_BATCH_SIZE:
+    return JsonResponse({'error': f'At most {settings.API_MAX_BATCH_SIZE} updates per request'}, status=400)
+
+  try:
+    model, parsed = parse_updates(table, updates)
+  except BulkUpdateError as e:
+    return JsonResponse({'error': str(e)}, status=400)
+
+  updated, conflicts = bulk_update(model, parsed)
+  return JsonResponse({'updated': updated, 'conflicts': conflicts})
+
+
+def _feed_params(request, cursor):
+  cursor = parse_cursor(cursor)
+  limit = min(int(request.GET.get('limit', 500)), settings.FEED_MAX_LIMIT)
+  tables = request.GET.getlist('table')
+  return cursor, max(limit, 1), tables
+
+
+def _feed_busy():
+  response = JsonResponse({'error': 'Too many open feed requests, try again later'}, status=503)
+  response['Retry-After'] = '5'
+  return response
+
+
+@require_GET
+@api_auth_required
+def state_changes(request):
+  """Long-poll feed of state table changes, e.g. GET /api/changes/?cursor=<cursor>&table=tile_state_band1
+
+  Returns {"changes": [...], "cursor": "<cursor>"} as soon as there are changes after the cursor, or an
+  empty list after `timeout` seconds. Pass the returned cursor to the next request.
+  """
+  try:
+    cursor, limit, tables = _feed_params(request, request.GET.get('cursor'))
+    timeout = min(float(request.GET.get('timeout', 25)), settings.FEED_MAX_TIMEOUT)
+  except ValueError:
+    return JsonResponse({'error': 'Invalid cursor, limit or timeout'}, status=400)
+
+  try:
+    with FeedSlot():
+      changes, next_cursor = poll_changes(cursor, limit, max(timeout, 0), tables)
+  except FeedBusy:
+    return _feed_busy()
+  return JsonResponse({'changes': changes, 'cursor': format_cursor(*next_cursor)})
+
+
+@require_GET
+@api_auth_required
+def state_change_stream(request):
+  """Server-sent event stream of state table changes, GET /api/changes/stream/?cursor=<cursor>
+
+  Each change is sent as a "change" event with the feed cursor as event id, so clients reconnect
+  from where they left off (Last-Event-ID). The stream ends after FEED_STREAM_MAX_AGE seconds.
+  """
+  try:
+    cursor, limit, tables = _feed_params(
+      request, request.headers.get('Last-Event-ID') or request.GET.get('cursor'))
+  except ValueError:
+    return JsonResponse({'error': 'Invalid cursor or limit'}, status=400)
+
+  def events(cursor):
+    deadline = time.monotonic() + settings.FEED_STREAM_MAX_AGE
+    while time.monotonic() < deadline:
+      changes, cursor = poll_changes(cursor, limit, 15, tables)
+      if not changes:
+        yield ': keep-alive\n\n'
+        continue
+      for change in changes[:-1]:
+        yield f'event: change\ndata: {json.dumps(change, cls=DjangoJSONEncoder)}\n\n'
+      yield f'id: {format_cursor(*cursor)}\nevent: change\ndata: {json.dumps(changes[-1], cls=DjangoJSONEncoder)}\n\n'
+
+  try:
+    slot = FeedSlot()
+  except FeedBusy:
+    return _feed_busy()
+  response = streaming_response(request, slot.stream(events(cursor)), content_type='text/event-stream')
+  response['Cache-Control'] = 'no-cache'
+  response['X-Accel-Buffering'] = 'no'
+  return response
+
+
+def _queue_request(request):
+  """JSON body of a queue request, with the worker name and lease duration checked"""
+  body = json.loads(request.body)
+  if not isinstance(body, dict) or not isinstance(body.get('worker'), str) or not body['worker']:
+    raise ValueError('Expected a JSON object with a "worker" name')
+  lease = int(body.get('lease', settings.QUEUE_DEFAULT_LEASE))
+  if not 0 < lease <= settings.QUEUE_MAX_LEASE:
+    raise ValueError(f'lease must be between 1 and {settings.QUEUE_MAX_LEASE} seconds')
+  return body, lease
+
+
+@require_POST
+@api_auth_required(permissions=_queue_permissions)
+def queue_claim(request, band):
+  """Lease pending 1D pipeline regions, e.g. POST /api/queue/1/claim/
+
+  {"worker": "node12-3", "limit": 10, "lease": 600}
+
+  Returns {"regions": [...]} (possibly empty). Each region is leased for `lease` seconds and set
+  to Running; extend the lease with heartbeat/ and finish with complete/.
+  """
+  try:
+    body, lease = _queue_request(request)
+    limit = int(body.get('limit', 1))
+  except (ValueError, TypeError) as e:
+    return JsonResponse({'error': str(e)}, status=400)
+  if not 0 < limit <= settings.QUEUE_MAX_CLAIM:
+    return JsonResponse({'error': f'limit must be between 1 and {settings.QUEUE_MAX_CLAIM}'}, status=400)
+
+  regions = queue.claim(band, body['worker'], limit, lease)
+  return JsonResponse({'regions': regions})
+
+
+@require_POST
+@api_auth_required(permissions=_queue_permissions)
+def queue_heartbeat(request, band):
+  """Extend leases, e.g. POST /api/queue/1/heartbeat/ {"worker": "node12-3", "ids": [101, 102]}
+
+  Returns {"renewed": [...]}; ids missing from it are no longer leased by this worker.
+  """
+  try:
+    body, lease = _queue_request(request)
+    ids = [int(i) for i in body['ids']]
+  except KeyError:
+    return JsonResponse({'error': 'Expected a list of "ids"'}, status=400)
+  except (ValueError, TypeError) as e:
+    return JsonResponse({'error': str(e)}, status=400)
+  if len(ids) > settings.API_MAX_BATCH_SIZE:
+    return JsonResponse({'error': f'At most {settings.API_MAX_BATCH_SIZE} ids per request'}, status=400)
+
+  return JsonResponse({'renewed': queue.heartbeat(band, body['worker'], ids, lease)})
+
+
+@require_POST
+@api_auth_required(permissions=_queue_permissions)
+def queue_complete(request, band):
+  """Finish leased regions, e.g. POST /api/queue/1/complete/
+
+  {"worker": "node12-3", "results": {"101": "Completed", "102": "Failed", "103": null}}
+
+  null releases the region back to pending. Returns {"completed": [...]}; ids missing from it were
+  no longer leased by this worker and are unchanged.
+  """
+  try:
+    body, _ = _queue_request(request)
+    results = {int(k): v for k, v in body['results'].items()}
+  except (KeyError, AttributeError):
+    return JsonResponse({'error': 'Expected an object of "results"'}, status=400)
+  except (ValueError, TypeError) as e:
+    return JsonResponse({'error': str(e)}, status=400)
+  if any(state is not None and state not in queue.FINAL_STATES for state in results.values()):
+    return JsonResponse({'error': f'States must be one of {", ".join(queue.FINAL_STATES)} or null'}, status=400)
+  if len(results) > settings.API_MAX_BATCH_SIZE:
+    return JsonResponse({'error': f'At most {settings.API_MAX_BATCH_SIZE} results per request'}, status=400)
+
+  return JsonResponse({'completed': queue.complete(band, body['worker'], results)})
+
+
+@staff_member_required
+def dashboard(request):
+  """Survey progress: rows per state for each band, and state changes per day"""
+  days = 30
+  context = dict(
+    admin.site.each_context(request),
+    title='Survey progress',
+    bands=BANDS,
+    panels=state_counts(),
+    history=state_history(days),
+    days=days,
+  )
+  return render(request, 'processing_states/dashboard.html', context)
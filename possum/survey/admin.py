@@ -1,9 +1,10 @@
 from django.contrib import admin
-from django.utils.html import format_html
-from django.db.models.aggregates import Count
-from django.db.models import Q, Count
+from django.db.models import F
+from django.db.models.functions import Coalesce
 
 from .models import Observation, AssociatedTile, Tile, Validation
+from .paginator import EstimatedCountPaginator
+from .search import IndexedSearchMixin
 
 class AssociatedTileAdminInline(admin.TabularInline):
     model = AssociatedTile
@@ -18,60 +19,14 @@ class AssociatedTileAdminInline(admin.TabularInline):
     def has_change_permission(self, request, obj=None):
         return False
 
-
-class Band1FieldTileAdminInline(admin.TabularInline):
-    readonly_fields = ('obs_start', 'sbid', 'processed_date', 'validated_date',
-                       'validated_state')
-
-    model = AssociatedTile
-
-    can_delete = False
-    can_add = False
-    show_change_link = True
-
-    verbose_name = "Band 1 Field Tile"
-
-    def obs_start(self, obj):
-        val = obj.name.obs_start
-        if val is None:
-            return '-'
-        return val
-
-    def sbid(self, obj):
-        val = obj.name.sbid
-        if val is None:
-            return '-'
-        return val
-
-    def processed_date(self, obj):
-        val = obj.name.processed_date
-        if val is None:
-            return '-'
-        return val
-
-    def validated_date(self, obj):
-        val = obj.name.validated_date
-        if val is None:
-            return '-'
-        return val
-
-    def validated_state(self, obj):
-        val = obj.name.validated_state
-        if val is None:
-            return '-'
-
-    def has_add_permission(self, request, obj):
-        return False
-
-    def has_change_permission(self, request, obj):
-        return False
-
     def get_queryset(self, request):
-        qs = super(Band1FieldTileAdminInline, self).get_queryset(request)
-        return qs.filter(name__band=1)
+        qs = super(AssociatedTileAdminInline, self).get_queryset(request)
+        return qs.select_related('name', 'tile')
 
 
-class Band2FieldTileAdminInline(admin.TabularInline):
+class BandFieldTileAdminInline(admin.TabularInline):
+    """Observations of one band covering a tile"""
+    band = None
     readonly_fields = ('obs_start', 'sbid', 'processed_date', 'validated_date',
                        'validated_state')
 
@@ -81,8 +36,6 @@ class Band2FieldTileAdminInline(admin.TabularInline):
     can_add = False
     show_change_link = True
 
-    verbose_name = "Band 2 Field Tile"
-
     def obs_start(self, obj):
         val = obj.name.obs_start
         if val is None:
@@ -113,30 +66,6 @@ class Band2FieldTileAdminInline(admin.TabularInline):
             return '-'
         return val
 
-    def mfs_update(self, obj):
-        val = obj.name.mfs_update
-        if val is None:
-            return '-'
-        return val
-
-    def mfs_state(self, obj):
-        val = obj.name.mfs_state
-        if val is None:
-            return '-'
-        return val
-
-    def cube_update(self, obj):
-        val = obj.name.cube_update
-        if val is None:
-            return '-'
-        return val
-
-    def cube_state(self, obj):
-        val = obj.name.cube_state
-        if val is None:
-            return '-'
-        return val
-
     def has_add_permission(self, request, obj=None):
         return False
 
@@ -144,8 +73,19 @@ class Band2FieldTileAdminInline(admin.TabularInline):
         return False
 
     def get_queryset(self, request):
-        qs = super(Band2FieldTileAdminInline, self).get_queryset(request)
-        return qs.filter(name__band=2)
+        qs = super(BandFieldTileAdminInline, self).get_queryset(request)
+        # Observation columns are read from obj.name, fetch them in the same query
+        return qs.filter(name__band=self.band).select_related('name', 'tile')
+
+
+class Band1FieldTileAdminInline(BandFieldTileAdminInline):
+    band = 1
+    verbose_name = "Band 1 Field Tile"
+
+
+class Band2FieldTileAdminInline(BandFieldTileAdminInline):
+    band = 2
+    verbose_name = "Band 2 Field Tile"
 
 
 class ValidationAdminInline(admin.TabularInline):
@@ -161,6 +101,8 @@ class ValidationAdminInline(admin.TabularInline):
 
 
 class ValidationAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     model = Validation
     list_display = [field.name for field in Validation._meta.get_fields()]
 
@@ -173,7 +115,9 @@ class ValidationAdmin(admin.ModelAdmin):
         return qs.filter()
 
 
-class ObservationAdmin(admin.ModelAdmin):
+class ObservationAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     inlines = [AssociatedTileAdminInline, ValidationAdminInline]
 
     list_display = ('name', 'ra_deg', 'dec_deg', 'band', 'obs_start', 'sbid', 'processed_date', 'validated_date',
@@ -194,6 +138,7 @@ class ObservationAdmin(admin.ModelAdmin):
                      'sbid',
                      'validated_state',
                      'associatedtile__tile__tile')
+    exact_search_fields = ('sbid',)
 
     can_delete = False
     can_add = False
@@ -203,7 +148,9 @@ class ObservationAdmin(admin.ModelAdmin):
         return False
 
 
-class TileAdmin(admin.ModelAdmin):
+class TileAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     inlines = [Band1FieldTileAdminInline, Band2FieldTileAdminInline,]
     list_display = ('tile', 'ra_deg', 'dec_deg', 'gl', 'gb', 'band1_count', 'band2_count')
     readonly_fields = ('tile', 'ra_deg', 'dec_deg', 'gl', 'gb')
@@ -223,13 +170,10 @@ class TileAdmin(admin.ModelAdmin):
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
+        # Counts are precomputed in possum.tile_band_count when the tile map is ingested
         qs = qs.annotate(
-            band1_count=Count('associatedtile',
-                              filter=Q(associatedtile__name__band=1))).order_by('band1_count')
-
-        qs = qs.annotate(
-            band2_count=Count('associatedtile',
-                              filter=Q(associatedtile__name__band=2))).order_by('band2_count')
+            band1_count=Coalesce(F('band_count__band1_count'), 0),
+            band2_count=Coalesce(F('band_count__band2_count'), 0)).order_by('band2_count')
 
         return qs
 
@@ -0,0 +1,45 @@
+import hmac
+from functools import wraps
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.views.decorators.csrf import csrf_exempt
+
+
+def api_auth_required(view=None, *, permissions=None):
+    """Authentication for the machine-facing JSON API.
+
+    Accepts either the pipeline token (`Authorization: Token <PIPELINE_API_TOKEN>`) or a logged in
+    staff user. CSRF protection is only skipped for token authenticated requests.
+    For endpoints that write, `permissions(request, *args, **kwargs)` returns the model permissions
+    (e.g. ['processing_states.change_tilestatesband1']) a logged in user needs; it returns None when
+    the target does not exist, which is left to the view to report.
+    """
+    if view is None:
+        return lambda view: api_auth_required(view, permissions=permissions)
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        token = settings.PIPELINE_API_TOKEN
+        header = request.headers.get('Authorization', '')
+        if token and header.startswith('Token ') and hmac.compare_digest(header[6:].strip(), token):
+            return view(request, *args, **kwargs)
+
+        if request.user.is_authenticated and request.user.is_staff:
+            required = permissions(request, *args, **kwargs) if permissions else None
+            if required and not request.user.has_perms(required):
+                return JsonResponse({'error': 'Permission denied'}, status=403)
+            reason = CsrfViewMiddleware(lambda r: None).process_view(request, None, (), {})
+            if reason is not None:
+                return JsonResponse({'error': 'CSRF verification failed'}, status=403)
+            return view(request, *args, **kwargs)
+
+        return JsonResponse({'error': 'Unauthorized'}, status=401)
+
+    return csrf_exempt(wrapper)
+
+
+def change_permission(model):
+    """Permission name for changing rows of a model, e.g. 'processing_states.change_tilestatesband1'"""
+    return f'{model._meta.app_label}.change_{model._meta.model_name}'
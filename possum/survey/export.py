@@ -0,0 +1,135 @@
+import csv
+import io
+
+from django.apps import apps
+from django.db import models, router
+
+
+# Tables that can be exported, by export name
+EXPORTS = {
+    'validation': 'survey.Validation',
+    'tile_map': 'survey.AssociatedTile',
+    'observation_state_band1': 'processing_states.ObservationStatesBand1',
+    'observation_state_band2': 'processing_states.ObservationStatesBand2',
+    'tile_state_band1': 'processing_states.TileStatesBand1',
+    'tile_state_band2': 'processing_states.TileStatesBand2',
+    'observation_state': 'processing_states.ObservationState',
+    'tile_state': 'processing_states.TileState',
+}
+FORMATS = ('csv', 'parquet')
+CHUNK_SIZE = 5000
+
+
+def export_model(name):
+    return apps.get_model(EXPORTS[name])
+
+
+def _rows(model, chunk_size, using):
+    """All rows as tuples of column values, read with a server-side cursor"""
+    fields = model._meta.concrete_fields
+    qs = model._default_manager.using(using).order_by(model._meta.pk.name).values_list(*[f.attname for f in fields])
+    return qs.iterator(chunk_size=chunk_size)
+
+
+def _chunks(rows, chunk_size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def csv_stream(model, chunk_size=CHUNK_SIZE, using=None):
+    """CSV export, yielding one string per chunk of rows. The header uses the database column names."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([f.column for f in model._meta.concrete_fields])
+    for chunk in _chunks(_rows(model, chunk_size, using), chunk_size):
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+class _ChunkSink:
+    """Write-only file object that collects the bytes written by the Parquet writer"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def writable(self):
+        return True
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _arrow_type(pa, field):
+    if field.is_relation:
+        field = field.target_field
+    if isinstance(field, models.BooleanField):
+        return pa.bool_()
+    if isinstance(field, models.IntegerField):
+        return pa.int64()
+    if isinstance(field, (models.FloatField, models.DecimalField)):
+        return pa.float64()
+    if isinstance(field, models.DateTimeField):
+        return pa.timestamp('us', tz='UTC')
+    return pa.string()
+
+
+def _convert(values, arrow_type, pa):
+    """Decimal values are written as float64"""
+    if pa.types.is_floating(arrow_type):
+        return [None if v is None else float(v) for v in values]
+    return values
+
+
+def parquet_stream(model, chunk_size=CHUNK_SIZE, using=None):
+    """Parquet export, one row group per chunk of rows. Requires pyarrow (optional dependency)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    fields = model._meta.concrete_fields
+    schema = pa.schema([(f.column, _arrow_type(pa, f)) for f in fields])
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for chunk in _chunks(_rows(model, chunk_size, using), chunk_size):
+            columns = list(zip(*chunk))
+            arrays = [pa.array(_convert(column, t, pa), type=t) for column, t in zip(columns, schema.types)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def export_stream(name, fmt, chunk_size=CHUNK_SIZE):
+    """Export generator for a table. The database is chosen when the export starts (not when the
+    response is streamed), so routing to the read replica applies to the whole export."""
+    model = export_model(name)
+    using = router.db_for_read(model)
+    if fmt == 'parquet':
+        return parquet_stream(model, chunk_size, using)
+    return csv_stream(model, chunk_size, using)
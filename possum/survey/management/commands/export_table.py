@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from survey.export import EXPORTS, FORMATS, CHUNK_SIZE, export_stream
+
+
+class Command(BaseCommand):
+    help = 'Export a whole table as CSV or Parquet, streaming rows with a server-side cursor'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(EXPORTS))
+        parser.add_argument('-f', '--format', choices=FORMATS, default='csv')
+        parser.add_argument('-o', '--output', help='Output file (default: stdout, CSV only)')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help='Rows fetched from the cursor and written per chunk')
+
+    def handle(self, *args, **options):
+        fmt = options['format']
+        if options['chunk_size'] <= 0:
+            raise CommandError('Chunk size must be positive')
+        if fmt == 'parquet':
+            if not options['output']:
+                raise CommandError('Parquet export requires --output')
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise CommandError('Parquet export requires pyarrow (pip install pyarrow)')
+
+        stream = export_stream(options['name'], fmt, options['chunk_size'])
+        if not options['output']:
+            for chunk in stream:
+                self.stdout.write(chunk, ending='')
+            return
+
+        mode = 'wb' if fmt == 'parquet' else 'w'
+        with open(options['output'], mode, **({} if fmt == 'parquet' else {'newline': ''})) as f:
+            for chunk in stream:
+                f.write(chunk)
+        self.stderr.write(f'Exported {options["name"]} to {options["output"]}')
@@ -0,0 +1,45 @@
+import glob
+import os
+import time
+
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+
+from survey.validation_reports import column_kinds, read_report, check_reports, upsert_reports
+
+
+class Command(BaseCommand):
+    help = 'Load a directory of validation reports (*.csv and *.json) into validation, upserting on field_id'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Directory of validation reports (*.csv and *.json)')
+        parser.add_argument('--check', action='store_true', default=False,
+                            help='Only check the reports, do not load them')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        directory = options['directory']
+        if not os.path.isdir(directory):
+            raise CommandError(f'{directory} is not a directory')
+        files = sorted(glob.glob(os.path.join(directory, '*.csv')) + glob.glob(os.path.join(directory, '*.json')))
+        if not files:
+            raise CommandError('No validation reports found')
+        frames = []
+        for path in files:
+            try:
+                with open(path, encoding='utf-8') as f:
+                    frames.append(read_report(os.path.basename(path), f))
+            except (ValueError, UnicodeDecodeError) as e:
+                raise CommandError(f'Could not read {path}: {e}')
+        frame = pd.concat(frames, ignore_index=True)
+
+        rows, errors = check_reports(frame, column_kinds())
+        self.stdout.write(f'Checked {len(files)} reports: {len(frame)} rows, {len(rows)} valid '
+                          f'({time.perf_counter() - start:.2f}s)')
+        if not options['check'] and len(rows):
+            inserted, updated, unknown = upsert_reports(rows)
+            errors.extend(f'Unknown observation {field_id}' for field_id in unknown)
+            self.stdout.write(f'Inserted {inserted} and updated {updated} validation rows '
+                              f'({time.perf_counter() - start:.2f}s)')
+        for error in errors:
+            self.stdout.write(error)
@@ -0,0 +1,55 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class TokenCache:
+    """Thread-safe LRU cache of token introspection results (or other per token data).
+
+    Entries are keyed by the SHA-256 hash of the token, so tokens are never kept in memory as keys.
+    An entry is fresh for `ttl` seconds and is never kept past the token expiry (`exp` claim).
+    Entries older than `ttl` but before expiry can still be read with `stale=True`, which is used
+    to keep serving requests while Keycloak is slow or unreachable.
+    """
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(token):
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def get(self, token, stale=False):
+        key = self.key(token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            data, fresh_until, expires_at = entry
+            if now >= expires_at:
+                del self._entries[key]
+                return None
+            if now >= fresh_until and not stale:
+                return None
+            self._entries.move_to_end(key)
+            return data
+
+    def set(self, token, data):
+        now = time.time()
+        expires_at = now + self.ttl
+        if data.get('active', False) and data.get('exp'):
+            expires_at = float(data['exp'])
+        fresh_until = min(now + self.ttl, expires_at)
+        if fresh_until <= now:
+            return
+        key = self.key(token)
+        with self._lock:
+            self._entries[key] = (data, fresh_until, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
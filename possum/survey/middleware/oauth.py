@@ -7,47 +7,250 @@ from social_django.models import UserSocialAuth
 from keycloak import KeycloakOpenID
 from django.http import HttpResponse
 
+import functools
 import json
+import logging
+
+import httpx
+import jwt
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+from .cache import TokenCache
+
+
+logger = logging.getLogger(__name__)
+
+
+@functools.cache
+def basic_group():
+    """Group new staff users are added to, looked up once per process"""
+    return Group.objects.get(name='Basic')
 
 
 class KeycloakMiddleware:
+    sync_capable = True
+    async_capable = True
 
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
         self.groups = settings.AUTH_GROUPS
         self.openid = KeycloakOpenID(server_url=settings.CLIENT_AUTH,
                                      client_id=settings.SOCIAL_AUTH_KEYCLOAK_KEY,
                                      realm_name=settings.REALM,
                                      client_secret_key=settings.SOCIAL_AUTH_KEYCLOAK_SECRET)
+        self.local_verification = settings.LOCAL_TOKEN_VERIFICATION
+        if self.local_verification:
+            # Introspection is then only used to check for revoked tokens
+            ttl = settings.REVOCATION_CHECK_INTERVAL
+            self.jwks_client = jwt.PyJWKClient(settings.JWKS_URL) if settings.JWKS_URL else None
+            self.public_key = settings.SOCIAL_AUTH_KEYCLOAK_PUBLIC_KEY
+            self.issuer = f"{settings.CLIENT_AUTH.rstrip('/')}/realms/{settings.REALM}"
+            if not self.public_key.startswith('-----BEGIN'):
+                self.public_key = '\n'.join(['-----BEGIN PUBLIC KEY-----', self.public_key, '-----END PUBLIC KEY-----'])
+        else:
+            ttl = settings.INTROSPECTION_CACHE_TTL
+        self.cache = TokenCache(ttl=ttl, max_size=settings.INTROSPECTION_CACHE_SIZE)
+        # Social auth access token per session (the session key changes on every login)
+        self.session_tokens = TokenCache(ttl=settings.INTROSPECTION_CACHE_TTL,
+                                         max_size=settings.INTROSPECTION_CACHE_SIZE)
 
-    def __call__(self, request):
+        # Used by the async request path (ASGI)
+        self.http = None
+        self.introspect_url = (f"{settings.CLIENT_AUTH.rstrip('/')}/realms/{settings.REALM}"
+                               f"/protocol/openid-connect/token/introspect")
+
+    def verify(self, token):
+        """Validate the signature and expiry of the access token locally, against the JWKS of the
+        realm (JWKS_URL) or the configured realm public key. The token must be issued by the realm
+        for this client: its audience (aud) or authorised party (azp) is SOCIAL_AUTH_KEYCLOAK_KEY.
+        Returns the token claims.
+
+        """
+        try:
+            if self.jwks_client is not None:
+                key = self.jwks_client.get_signing_key_from_jwt(token).key
+            else:
+                key = self.public_key
+            # Keycloak access tokens name the client in azp, aud is often only "account"
+            claims = jwt.decode(token, key, algorithms=['RS256'], leeway=10, issuer=self.issuer,
+                                options={'verify_aud': False, 'require': ['exp', 'iss']})
+            audience = claims.get('aud') or []
+            if isinstance(audience, str):
+                audience = [audience]
+            client = settings.SOCIAL_AUTH_KEYCLOAK_KEY
+            if client not in audience and claims.get('azp') != client:
+                raise jwt.InvalidAudienceError('Token not issued for this client')
+        except jwt.PyJWTError:
+            logger.info('Access token failed local verification', exc_info=True)
+            return {'active': False}
+        claims['active'] = True
+        return claims
+
+    def token_data(self, token):
+        """Claims of the access token (active flag and user_groups).
+        With LOCAL_TOKEN_VERIFICATION the token is verified locally and introspection is only used to
+        check for revocation, at most once every REVOCATION_CHECK_INTERVAL seconds per token. If
+        Keycloak cannot be reached and there is no cached result, the verified claims are used.
+
+        """
+        if not self.local_verification or not token:
+            return self.introspect(token)
+
+        claims = self.verify(token)
+        if claims['active'] is False:
+            return claims
+        try:
+            data = self.introspect(token)
+        except Exception:
+            # The token itself has been verified, the revocation check is best effort
+            logger.warning('Revocation check failed, using the locally verified token', exc_info=True)
+            return claims
+        if data.get('active', False) is False:
+            claims['active'] = False
+        return claims
+
+    def introspect(self, token):
+        """Introspection result for the access token, cached until the token expires or for at most
+        INTROSPECTION_CACHE_TTL seconds. If Keycloak cannot be reached a stale cached result is used.
+
+        """
+        if not token:
+            return self.openid.introspect(token)
+
+        data = self.cache.get(token)
+        if data is not None:
+            return data
+        try:
+            data = self.openid.introspect(token)
+        except Exception:
+            data = self.cache.get(token, stale=True)
+            if data is None:
+                raise
+            logger.warning('Token introspection failed, using cached result', exc_info=True)
+            return data
+        self.cache.set(token, data)
+        return data
+
+    async def aintrospect(self, token):
+        """Async version of introspect, calling the Keycloak introspection endpoint with httpx.
+
+        """
+        data = self.cache.get(token) if token else None
+        if data is not None:
+            return data
+        try:
+            if self.http is None:
+                self.http = httpx.AsyncClient(timeout=settings.INTROSPECTION_TIMEOUT)
+            response = await self.http.post(self.introspect_url, data={
+                'token': token,
+                'client_id': settings.SOCIAL_AUTH_KEYCLOAK_KEY,
+                'client_secret': settings.SOCIAL_AUTH_KEYCLOAK_SECRET
+            })
+            response.raise_for_status()
+            data = response.json()
+        except Exception:
+            data = self.cache.get(token, stale=True) if token else None
+            if data is None:
+                raise
+            logger.warning('Token introspection failed, using cached result', exc_info=True)
+            return data
+        if token:
+            self.cache.set(token, data)
+        return data
+
+    async def atoken_data(self, token):
+        """Async version of token_data.
+
+        """
+        if not self.local_verification or not token:
+            return await self.aintrospect(token)
+
+        if self.jwks_client is not None:
+            # Fetching the realm keys may block, keep it off the event loop
+            claims = await sync_to_async(self.verify, thread_sensitive=False)(token)
+        else:
+            claims = self.verify(token)
+        if claims['active'] is False:
+            return claims
+        try:
+            data = await self.aintrospect(token)
+        except Exception:
+            logger.warning('Revocation check failed, using the locally verified token', exc_info=True)
+            return claims
+        if data.get('active', False) is False:
+            claims['active'] = False
+        return claims
+
+    def access_token(self, request):
+        """Make sure the authenticated user is staff and return (has_social_auth, access_token).
+        The social auth lookup is cached per session for INTROSPECTION_CACHE_TTL seconds.
+
+        """
         user = request.user
-        if user.is_authenticated:
-            if user.is_staff is False:
-                group = Group.objects.get(name='Basic')
-                user.groups.add(group)
-                user.is_staff = True
-                user.save()
-
-            auth = user.social_auth.first()
-            if auth is None:
-                response = self.get_response(request)
-                return response
+        if user.is_staff is False:
+            user.groups.add(basic_group())
+            user.is_staff = True
+            user.save()
+
+        session_key = request.session.session_key
+        cache_key = f'{session_key}:{user.pk}' if session_key else None
+        cached = self.session_tokens.get(cache_key) if cache_key else None
+        if cached is not None:
+            return cached['has_auth'], cached['access_token']
 
+        auth = user.social_auth.first()
+        if auth is None:
+            has_auth, token = False, None
+        else:
             extra = auth.extra_data
             if isinstance(extra, str):
                 extra = json.loads(extra)
-            data = self.openid.introspect(extra.get('access_token'))
+            has_auth, token = True, extra.get('access_token')
+        if cache_key:
+            self.session_tokens.set(cache_key, {'has_auth': has_auth, 'access_token': token})
+        return has_auth, token
 
-            jwt_groups = data.get('user_groups', None)
-            if jwt_groups:
-                if any(item in self.groups for item in jwt_groups) is False:
-                    err = f"Unauthorized, not a member of any group: {', '.join(self.groups)}"
-                    return HttpResponse(err, status=401)
+    def authorise(self, request, data):
+        """Response for a token that is not in the authorised groups or no longer active.
+        Returns None if the request can proceed.
 
-            if data.get('active', False) is False:
-                logout(request)
-                return redirect(settings.LOGIN_REDIRECT_URL)
+        """
+        jwt_groups = data.get('user_groups', None)
+        if jwt_groups:
+            if any(item in self.groups for item in jwt_groups) is False:
+                err = f"Unauthorized, not a member of any group: {', '.join(self.groups)}"
+                return HttpResponse(err, status=401)
+
+        if data.get('active', False) is False:
+            logout(request)
+            return redirect(settings.LOGIN_REDIRECT_URL)
+        return None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        if request.user.is_authenticated:
+            has_auth, token = self.access_token(request)
+            if has_auth:
+                response = self.authorise(request, self.token_data(token))
+                if response is not None:
+                    return response
 
         response = self.get_response(request)
         return response
+
+    async def __acall__(self, request):
+        is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+        if is_authenticated:
+            has_auth, token = await sync_to_async(self.access_token)(request)
+            if has_auth:
+                data = await self.atoken_data(token)
+                response = await sync_to_async(self.authorise)(request, data)
+                if response is not None:
+                    return response
+
+        response = await self.get_response(request)
+        return response
@@ -0,0 +1,60 @@
+import time
+
+from django.conf import settings
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from possum.db_router import use_replica
+
+
+PIN_COOKIE = 'replica_pin'
+
+
+class ReplicaMiddleware:
+    """Let read-only requests (GET/HEAD on settings.REPLICA_READ_PATHS) read from the replica.
+
+    After a request that may have written (any other method), the client is pinned to the primary
+    for settings.REPLICA_PIN_SECONDS with a cookie, so it reads its own writes even when the
+    replica lags behind.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def replica_allowed(self, request):
+        if request.method not in ('GET', 'HEAD'):
+            return False
+        if not request.path.startswith(tuple(settings.REPLICA_READ_PATHS)):
+            return False
+        try:
+            return float(request.COOKIES.get(PIN_COOKIE, 0)) < time.time()
+        except ValueError:
+            return True
+
+    def pin(self, request, response):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            pinned_until = time.time() + settings.REPLICA_PIN_SECONDS
+            response.set_cookie(PIN_COOKIE, f'{pinned_until:.0f}', max_age=settings.REPLICA_PIN_SECONDS,
+                                secure=settings.SESSION_COOKIE_SECURE, httponly=True, samesite='Lax')
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = use_replica.set(self.replica_allowed(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            use_replica.reset(token)
+        return self.pin(request, response)
+
+    async def __acall__(self, request):
+        token = use_replica.set(self.replica_allowed(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            use_replica.reset(token)
+        return self.pin(request, response)
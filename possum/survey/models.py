@@ -26,10 +26,10 @@ class AssociatedTile(models.Model):
         
 class Observation(models.Model):
     name = models.TextField(primary_key=True)
-    ra_deg = models.DecimalField(max_digits=65535, decimal_places=4, blank=True, null=True)
-    dec_deg = models.DecimalField(max_digits=65535, decimal_places=4, blank=True, null=True)
-    gl = models.DecimalField(max_digits=65535, decimal_places=4, blank=True, null=True)
-    gb = models.DecimalField(max_digits=65535, decimal_places=4, blank=True, null=True)
+    ra_deg = models.FloatField(blank=True, null=True)
+    dec_deg = models.FloatField(blank=True, null=True)
+    gl = models.FloatField(blank=True, null=True)
+    gb = models.FloatField(blank=True, null=True)
     rotation = models.FloatField(blank=True, null=True)
     duration = models.BigIntegerField(blank=True, null=True)
     centrefreq = models.BigIntegerField(blank=True, null=True)
@@ -52,10 +52,10 @@ class Observation(models.Model):
 
 class Tile(models.Model):
     tile = models.BigIntegerField(primary_key=True)
-    ra_deg = models.DecimalField(max_digits=65535, decimal_places=4, blank=True, null=True)
-    dec_deg = models.DecimalField(max_digits=65535, decimal_places=4, blank=True, null=True)
-    gl = models.DecimalField(max_digits=65535, decimal_places=4, blank=True, null=True)
-    gb = models.DecimalField(max_digits=65535, decimal_places=4, blank=True, null=True)
+    ra_deg = models.FloatField(blank=True, null=True)
+    dec_deg = models.FloatField(blank=True, null=True)
+    gl = models.FloatField(blank=True, null=True)
+    gb = models.FloatField(blank=True, null=True)
 
     def __str__(self):
         return str(self.tile)
@@ -65,6 +65,18 @@ class Tile(models.Model):
         db_table = 'tile'
 
 
+class TileBandCount(models.Model):
+    """Precomputed band coverage per tile, refreshed by possum.refresh_tile_band_count() (db/tile_band_count.sql)"""
+    tile = models.OneToOneField('Tile', models.DO_NOTHING, db_column='tile', to_field='tile', primary_key=True,
+                                related_name='band_count')
+    band1_count = models.IntegerField()
+    band2_count = models.IntegerField()
+
+    class Meta:
+        managed = False
+        db_table = 'tile_band_count'
+
+
 class Validation(models.Model):
     id = models.BigAutoField(primary_key=True)
     field_id = models.ForeignKey('Observation', db_column='field_id', on_delete=models.DO_NOTHING, to_field='name', blank=True, null=True)
@@ -0,0 +1,44 @@
+import json
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator for admin changelists on large tables.
+
+    Uses the PostgreSQL row estimate instead of an exact SELECT COUNT(*):
+    pg_class.reltuples for unfiltered querysets, the planner estimate (EXPLAIN) otherwise.
+    When the estimate is below settings.ESTIMATED_COUNT_THRESHOLD the exact count is used.
+    """
+
+    @cached_property
+    def count(self):
+        if not hasattr(self.object_list, 'query'):
+            return super().count
+        estimate = self.estimate_count(self.object_list)
+        if estimate is None or estimate < settings.ESTIMATED_COUNT_THRESHOLD:
+            return super().count
+        return estimate
+
+    @staticmethod
+    def estimate_count(queryset):
+        query = queryset.query
+        with connections[queryset.db].cursor() as cursor:
+            if not query.where and not query.distinct:
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)',
+                               [queryset.model._meta.db_table])
+                row = cursor.fetchone()
+                # reltuples is -1 (or 0) for tables that have not been analyzed yet
+                if row is None or row[0] <= 0:
+                    return None
+                return row[0]
+
+            sql, params = queryset.order_by().query.sql_with_params()
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]['Plan']['Plan Rows'])
@@ -0,0 +1,62 @@
+from django.db import connections, router
+
+from .models import Observation, Tile
+
+
+POSITION = 'spoint(radians(ra_deg), radians(dec_deg))'
+COORDINATES = ('ra_deg', 'dec_deg', 'gl', 'gb', 'distance')
+
+# Searchable tables and the columns returned for each match
+TABLES = {
+    'tile': (Tile, ('tile', 'ra_deg', 'dec_deg', 'gl', 'gb')),
+    'observation': (Observation, ('name', 'sbid', 'band', 'ra_deg', 'dec_deg', 'gl', 'gb')),
+}
+
+
+def _search(table, select, condition, order, params, limit):
+    """Run a search on the position index. condition is a region, or a list of regions the position
+    can be in. params are given in the order of select, condition, order."""
+    model, columns = TABLES[table]
+    connection = connections[router.db_for_read(model)]
+    qn = connection.ops.quote_name
+    conditions = [condition] if isinstance(condition, str) else condition
+    where = ' OR '.join(f'{POSITION} <@ {c}' for c in conditions)
+    names = list(columns) + [name for name, _ in select]
+    selected = [qn(c) for c in columns] + [expression for _, expression in select]
+    sql = (f'SELECT {", ".join(selected)} FROM {qn(model._meta.db_table)} '
+           f'WHERE {where} ORDER BY {order} LIMIT %s')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + [limit])
+        rows = cursor.fetchall()
+    return [{c: (float(v) if c in COORDINATES and v is not None else v) for c, v in zip(names, row)}
+            for row in rows]
+
+
+def cone_search(table, ra, dec, radius, limit):
+    """Rows within radius degrees of (ra, dec), nearest first, with their distance in degrees"""
+    centre = 'spoint(radians(%s), radians(%s))'
+    return _search(table,
+                   select=[('distance', f'degrees({POSITION} <-> {centre})')],
+                   condition=f'scircle({centre}, radians(%s))',
+                   order='distance',
+                   params=[ra, dec, ra, dec, radius],
+                   limit=limit)
+
+
+def box_search(table, ra_min, ra_max, dec_min, dec_max, limit):
+    """Rows inside the box from (ra_min, dec_min) to (ra_max, dec_max) degrees.
+    The box wraps through RA 0 when ra_min > ra_max, and covers all RA when ra_max - ra_min >= 360.
+
+    """
+    box = 'sbox(spoint(radians(%s), radians(%s)), spoint(radians(%s), radians(%s)))'
+    if ra_max - ra_min >= 360:
+        # spoint() takes RA 360 as 0, so all RA is searched as two halves
+        ranges = [(0, 180), (180, 0)]
+    else:
+        ranges = [(ra_min, ra_max)]
+    return _search(table,
+                   select=[],
+                   condition=[box] * len(ranges),
+                   order='dec_deg, ra_deg',
+                   params=[p for low, high in ranges for p in (low, dec_min, high, dec_max)],
+                   limit=limit)
@@ -0,0 +1,36 @@
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+
+
+class _AsyncChunks:
+    """Asynchronous iterator over a blocking one, each step runs in a worker thread.
+
+    The default thread sensitive executor keeps every step (and its database connection) on the
+    same thread for the whole request. close() is passed on, the response calls it when it is done.
+    """
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    async def __aiter__(self):
+        done = object()
+        chunks = iter(self.chunks)
+        step = sync_to_async(next)
+        while (chunk := await step(chunks, done)) is not done:
+            yield chunk
+
+    def close(self):
+        if hasattr(self.chunks, 'close'):
+            self.chunks.close()
+
+
+def streaming_response(request, chunks, **kwargs):
+    """StreamingHttpResponse for a blocking iterator that is also streamed when served over ASGI.
+
+    Django's ASGI handler consumes a synchronous iterator in full before sending any of it, which
+    holds back server-sent events and buffers whole exports in memory. Under ASGI the iterator is
+    wrapped in an asynchronous one instead, so each chunk is sent as soon as it is produced.
+    """
+    if isinstance(request, ASGIRequest):
+        chunks = _AsyncChunks(chunks)
+    return StreamingHttpResponse(chunks, **kwargs)
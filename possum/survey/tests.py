@@ -1,3 +1,274 @@
-from django.test import TestCase
+import io
+import time
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import jwt
+import pandas as pd
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from .middleware.cache import TokenCache
+from .middleware.oauth import KeycloakMiddleware
+from .spatial import box_search, cone_search
+from .views import box_search_view, cone_search_view
+from .validation_reports import check_reports, read_report, upsert_reports
+
+
+NOW = 1_700_000_000.0
+
+
+class TokenCacheTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch('survey.middleware.cache.time.time', return_value=NOW)
+        self.time = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_fresh_for_ttl(self):
+        cache = TokenCache(ttl=60, max_size=10)
+        cache.set('token', {'active': True, 'exp': NOW + 3600})
+        self.time.return_value = NOW + 59
+        self.assertEqual(cache.get('token'), {'active': True, 'exp': NOW + 3600})
+        self.time.return_value = NOW + 61
+        self.assertIsNone(cache.get('token'))
+        self.assertEqual(cache.get('token', stale=True), {'active': True, 'exp': NOW + 3600})
+
+    def test_not_kept_past_token_expiry(self):
+        cache = TokenCache(ttl=60, max_size=10)
+        cache.set('token', {'active': True, 'exp': NOW + 30})
+        self.time.return_value = NOW + 31
+        self.assertIsNone(cache.get('token', stale=True))
+
+    def test_expired_token_not_cached(self):
+        cache = TokenCache(ttl=60, max_size=10)
+        cache.set('token', {'active': True, 'exp': NOW - 1})
+        self.assertIsNone(cache.get('token', stale=True))
+
+    def test_inactive_result_expires_after_ttl(self):
+        cache = TokenCache(ttl=60, max_size=10)
+        cache.set('token', {'active': False})
+        self.time.return_value = NOW + 61
+        self.assertIsNone(cache.get('token', stale=True))
+
+    def test_least_recently_used_evicted(self):
+        cache = TokenCache(ttl=60, max_size=2)
+        cache.set('a', {'active': False})
+        cache.set('b', {'active': False})
+        cache.get('a')
+        cache.set('c', {'active': False})
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNotNone(cache.get('c'))
+
+
+KEYCLOAK_SETTINGS = dict(
+    AUTH_GROUPS=['possum'],
+    CLIENT_AUTH='https://keycloak.example/',
+    REALM='possum',
+    SOCIAL_AUTH_KEYCLOAK_KEY='client',
+    SOCIAL_AUTH_KEYCLOAK_SECRET='secret',
+    SOCIAL_AUTH_KEYCLOAK_PUBLIC_KEY='key',
+    LOCAL_TOKEN_VERIFICATION=False,
+    JWKS_URL=None,
+    INTROSPECTION_CACHE_TTL=60,
+    INTROSPECTION_CACHE_SIZE=10,
+    REVOCATION_CHECK_INTERVAL=300,
+)
+
+
+@override_settings(**KEYCLOAK_SETTINGS)
+class IntrospectionTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch('survey.middleware.cache.time.time', return_value=NOW)
+        self.time = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def middleware(self):
+        with mock.patch('survey.middleware.oauth.KeycloakOpenID'):
+            return KeycloakMiddleware(lambda request: None)
+
+    def test_cached_result_used_within_ttl(self):
+        middleware = self.middleware()
+        middleware.openid.introspect.return_value = {'active': True, 'exp': NOW + 3600}
+        middleware.introspect('token')
+        middleware.introspect('token')
+        self.assertEqual(middleware.openid.introspect.call_count, 1)
+
+    def test_stale_result_used_when_keycloak_fails(self):
+        middleware = self.middleware()
+        middleware.openid.introspect.return_value = {'active': True, 'exp': NOW + 3600}
+        middleware.introspect('token')
+        self.time.return_value = NOW + 120
+        middleware.openid.introspect.side_effect = ConnectionError
+        with self.assertLogs('survey.middleware.oauth', 'WARNING'):
+            self.assertEqual(middleware.introspect('token'), {'active': True, 'exp': NOW + 3600})
+
+    def test_error_raised_without_cached_result(self):
+        middleware = self.middleware()
+        middleware.openid.introspect.side_effect = ConnectionError
+        with self.assertRaises(ConnectionError):
+            middleware.introspect('token')
+
+    @override_settings(LOCAL_TOKEN_VERIFICATION=True)
+    def test_verified_claims_used_when_revocation_check_fails(self):
+        middleware = self.middleware()
+        middleware.openid.introspect.side_effect = ConnectionError
+        claims = {'active': True, 'user_groups': ['possum']}
+        with mock.patch.object(middleware, 'verify', return_value=claims):
+            with self.assertLogs('survey.middleware.oauth', 'WARNING'):
+                self.assertEqual(middleware.token_data('token'), claims)
+
+
+@override_settings(**KEYCLOAK_SETTINGS)
+class VerifyTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        cls.public_key = cls.private_key.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo).decode()
+
+    def middleware(self):
+        with self.settings(LOCAL_TOKEN_VERIFICATION=True, SOCIAL_AUTH_KEYCLOAK_PUBLIC_KEY=self.public_key), \
+                mock.patch('survey.middleware.oauth.KeycloakOpenID'):
+            return KeycloakMiddleware(lambda request: None)
+
+    def token(self, **claims):
+        claims = {'iss': 'https://keycloak.example/realms/possum', 'aud': 'account', 'azp': 'client',
+                  'exp': int(time.time()) + 3600, **claims}
+        return jwt.encode(claims, self.private_key, algorithm='RS256')
+
+    def verify(self, token):
+        return self.middleware().verify(token)
+
+    def test_valid_token(self):
+        self.assertTrue(self.verify(self.token())['active'])
+        self.assertTrue(self.verify(self.token(aud=['account', 'client'], azp='other'))['active'])
+
+    def test_wrong_issuer_rejected(self):
+        with self.assertLogs('survey.middleware.oauth', 'INFO'):
+            self.assertEqual(self.verify(self.token(iss='https://keycloak.example/realms/other')), {'active': False})
+
+    def test_wrong_audience_rejected(self):
+        with self.assertLogs('survey.middleware.oauth', 'INFO'):
+            self.assertEqual(self.verify(self.token(azp='other')), {'active': False})
+
+
+KINDS = {'field_id': 'text', 'rms': 'float', 'link': 'text', 'number_of_components_all': 'int'}
+
+
+class ValidationReportTests(SimpleTestCase):
+    def reports(self):
+        first = read_report('a.csv', io.StringIO('field_id,rms,link\n1412-28,0.5,http://a\n1415-31,0.7,http://b\n'))
+        second = read_report('b.json', io.StringIO('[{"field_id": "1412-28", "number_of_components_all": 12},'
+                                                   ' {"field_id": "1415-31", "rms": 0.9, "link": null}]'))
+        return pd.concat([first, second], ignore_index=True)
+
+    def test_rows_merged_by_provided_columns(self):
+        rows, errors = check_reports(self.reports(), KINDS)
+        self.assertEqual(errors, [])
+        rows = rows.set_index('field_id')
+        self.assertEqual(rows.loc['1412-28', '_provided'], ('field_id', 'rms', 'link', 'number_of_components_all'))
+        self.assertEqual(rows.loc['1412-28', 'rms'], 0.5)
+        self.assertEqual(rows.loc['1412-28', 'link'], 'http://a')
+        self.assertEqual(rows.loc['1412-28', 'number_of_components_all'], 12)
+        self.assertEqual(rows.loc['1415-31', '_provided'], ('field_id', 'rms', 'link'))
+        self.assertEqual(rows.loc['1415-31', 'rms'], 0.9)
+        self.assertTrue(pd.isna(rows.loc['1415-31', 'link']))
+
+    def test_only_provided_columns_written(self):
+        rows, _ = check_reports(self.reports(), KINDS)
+        rows = rows[rows['field_id'] == '1412-28']
+        second = read_report('c.json', io.StringIO('{"field_id": "1415-31", "rms": 0.9}'))
+        rows = pd.concat([rows, check_reports(second, KINDS)[0]], ignore_index=True)
+        with mock.patch('survey.validation_reports.connection') as connection, \
+                mock.patch('survey.validation_reports.transaction'):
+            connection.ops.quote_name = lambda name: f'"{name}"'
+            cursor = connection.cursor.return_value.__enter__.return_value
+            cursor.fetchall.side_effect = [[], [(True,)], [], [(False,)]]
+            self.assertEqual(upsert_reports(rows), (1, 1, []))
+        inserts = [c.args[0] for c in cursor.execute.call_args_list if c.args[0].startswith('INSERT')]
+        self.assertEqual(len(inserts), 2)
+        self.assertIn('"link" = EXCLUDED."link"', inserts[0])
+        self.assertIn('"number_of_components_all" = EXCLUDED."number_of_components_all"', inserts[0])
+        self.assertIn('("field_id", "rms")', inserts[1])
+        self.assertNotIn('"link"', inserts[1])
+
+
+class SpatialSearchTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch('survey.spatial.connections')
+        connections = patcher.start()
+        self.addCleanup(patcher.stop)
+        connection = connections.__getitem__.return_value
+        connection.ops.quote_name = lambda name: f'"{name}"'
+        self.cursor = connection.cursor.return_value.__enter__.return_value
+        self.cursor.fetchall.return_value = []
+
+    def executed(self):
+        (sql, params), = [c.args for c in self.cursor.execute.call_args_list]
+        return sql, params
+
+    def test_cone(self):
+        self.cursor.fetchall.return_value = [(1, Decimal('10.5'), Decimal('-20'), 1.0, 2.0, Decimal('0.5'))]
+        results = cone_search('tile', 10, -20, 2, 100)
+        sql, params = self.executed()
+        self.assertIn('<@ scircle(spoint(radians(%s), radians(%s)), radians(%s))', sql)
+        self.assertIn('ORDER BY distance LIMIT %s', sql)
+        self.assertEqual(params, [10, -20, 10, -20, 2, 100])
+        self.assertEqual(results, [{'tile': 1, 'ra_deg': 10.5, 'dec_deg': -20.0, 'gl': 1.0, 'gb': 2.0, 'distance': 0.5}])
+
+    def test_box(self):
+        box_search('observation', 340, 350, 0, 10, 100)
+        sql, params = self.executed()
+        self.assertEqual(sql.count('<@ sbox('), 1)
+        self.assertNotIn(' OR ', sql)
+        self.assertEqual(params, [340, 0, 350, 10, 100])
+
+    def test_box_across_ra_zero(self):
+        box_search('tile', 350, 10, -5, 5, 100)
+        sql, params = self.executed()
+        self.assertEqual(sql.count('<@ sbox('), 1)
+        self.assertEqual(params, [350, -5, 10, 5, 100])
+
+    def test_box_all_ra(self):
+        box_search('tile', 0, 360, -5, 5, 100)
+        sql, params = self.executed()
+        self.assertEqual(sql.count('<@ sbox('), 2)
+        self.assertIn(' OR ', sql)
+        self.assertEqual(params, [0, -5, 180, 5, 180, -5, 0, 5, 100])
+
+
+@override_settings(PIPELINE_API_TOKEN='token', SPATIAL_SEARCH_MAX_RADIUS=30.0, SPATIAL_SEARCH_MAX_LIMIT=10000)
+class SpatialSearchViewTests(SimpleTestCase):
+    def get(self, view, path, **params):
+        request = RequestFactory().get(path, params, HTTP_AUTHORIZATION='Token token')
+        return view(request, 'tile')
+
+    def test_non_finite_rejected(self):
+        with mock.patch('survey.views.cone_search') as search:
+            for value in ('nan', 'inf', '-inf'):
+                with self.subTest(value=value):
+                    response = self.get(cone_search_view, '/api/search/tile/cone/', ra=value, dec=0, radius=1)
+                    self.assertEqual(response.status_code, 400)
+        search.assert_not_called()
+        with mock.patch('survey.views.box_search') as search:
+            for name in ('ra_min', 'ra_max', 'dec_min', 'dec_max'):
+                with self.subTest(name=name):
+                    params = {'ra_min': 0, 'ra_max': 10, 'dec_min': 0, 'dec_max': 10, name: 'nan'}
+                    response = self.get(box_search_view, '/api/search/tile/box/', **params)
+                    self.assertEqual(response.status_code, 400)
+        search.assert_not_called()
+
+    def test_box_ra_normalised(self):
+        with mock.patch('survey.views.box_search', return_value=[]) as search:
+            self.get(box_search_view, '/api/search/tile/box/', ra_min=-10, ra_max=10, dec_min=0, dec_max=10)
+            self.get(box_search_view, '/api/search/tile/box/', ra_min=-180, ra_max=540, dec_min=0, dec_max=10)
+        self.assertEqual([c.args[1:3] for c in search.call_args_list], [(350, 10), (0, 360)])
+
+    def test_cone_ra_normalised(self):
+        with mock.patch('survey.views.cone_search', return_value=[]) as search:
+            response = self.get(cone_search_view, '/api/search/tile/cone/', ra=-10, dec=0, radius=1)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(search.call_args.args[:4], ('tile', 350, 0, 1))
@@ -0,0 +1,10 @@
+from django.urls import path
+
+from . import views
+
+urlpatterns = [
+    path('search/<str:table>/cone/', views.cone_search_view, name='cone_search'),
+    path('search/<str:table>/box/', views.box_search_view, name='box_search'),
+    path('export/<slug:name>.<slug:fmt>', views.export_view, name='export'),
+    path('validation/upload/', views.validation_upload, name='validation_upload'),
+]
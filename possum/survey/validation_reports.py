@@ -0,0 +1,147 @@
+import io
+import json
+import os
+
+import pandas as pd
+from django.db import connection, models, transaction
+
+from .models import Validation
+
+
+def column_kinds(model=Validation):
+    """Database column name -> 'int', 'float', 'timestamp' or 'text' for the columns a report may set"""
+    kinds = {}
+    for field in model._meta.concrete_fields:
+        if field.primary_key:
+            continue
+        if isinstance(field, models.IntegerField):
+            kinds[field.column] = 'int'
+        elif isinstance(field, models.FloatField):
+            kinds[field.column] = 'float'
+        elif isinstance(field, models.DateTimeField):
+            kinds[field.column] = 'timestamp'
+        else:
+            kinds[field.column] = 'text'
+    return kinds
+
+
+def _column_name(name):
+    return str(name).strip().lower()
+
+
+def read_report(name, f):
+    """Read one validation report (CSV with a header row, or a JSON object or list of objects).
+    The _provided column holds the columns each row sets: the header of a CSV file, or the keys
+    of each JSON object.
+
+    """
+    if os.path.splitext(name)[1].lower() == '.json':
+        data = json.load(f)
+        records = data if isinstance(data, list) else [data]
+        frame = pd.DataFrame(records)
+        provided = [frozenset(_column_name(k) for k in r) if isinstance(r, dict) else frozenset() for r in records]
+    else:
+        frame = pd.read_csv(f, dtype=str)
+        provided = [frozenset(_column_name(c) for c in frame.columns)] * len(frame)
+    frame.columns = [_column_name(c) for c in frame.columns]
+    frame['_source'] = [f'{name}:{i + 1}' for i in range(len(frame))]
+    frame['_provided'] = provided
+    return frame
+
+
+def check_reports(frame, kinds):
+    """Vectorised checks of a batch of reports.
+
+    Each column is converted to its database type in one pass; values that are present but
+    do not convert are reported, and the rows holding them are dropped. Rows without a
+    field_id are dropped. Rows that share a field_id are merged: each column takes the value of
+    the last row that provides it.
+    Returns (valid rows, errors). The _provided column of the valid rows is the tuple of columns
+    they set (in the order of kinds), the other columns are left unchanged by upsert_reports.
+
+    """
+    errors = [f'Unknown column {c}' for c in frame.columns
+              if c not in kinds and c not in ('_source', '_provided', 'id')]
+    if 'field_id' not in frame.columns:
+        return frame.iloc[0:0], errors + ['Missing column field_id']
+
+    columns = [c for c in frame.columns if c in kinds]
+    checked = pd.DataFrame(index=frame.index)
+    invalid = pd.Series(False, index=frame.index)
+    for column in columns:
+        raw = frame[column]
+        present = raw.notna() & (raw.astype('string').str.strip() != '')
+        kind = kinds[column]
+        if kind in ('int', 'float'):
+            converted = pd.to_numeric(raw.where(present), errors='coerce')
+            bad = present & converted.isna()
+            if kind == 'int':
+                bad |= converted.notna() & (converted % 1 != 0)
+                converted = converted.where(~bad).round().astype('Int64')
+        elif kind == 'timestamp':
+            converted = pd.to_datetime(raw.where(present), errors='coerce', utc=True, format='mixed').dt.tz_localize(None)
+            bad = present & converted.isna()
+        else:
+            converted = raw.astype('string').str.strip().where(present)
+            bad = pd.Series(False, index=frame.index)
+        for source, value in zip(frame.loc[bad, '_source'], raw[bad]):
+            errors.append(f'{source}: invalid {column} value {value!r}')
+        invalid |= bad
+        checked[column] = converted
+
+    missing = checked['field_id'].isna()
+    errors.extend(f'{source}: missing field_id' for source in frame.loc[missing, '_source'])
+    keep = ~(invalid | missing)
+    checked = checked[keep]
+    provided = frame.loc[keep, '_provided']
+
+    merged = checked[['field_id']].drop_duplicates('field_id', keep='last').set_index('field_id', drop=False)
+    merged_provided = pd.DataFrame(index=merged.index)
+    for column in columns:
+        rows = checked[provided.map(lambda p: column in p)]
+        last = rows.drop_duplicates('field_id', keep='last').set_index('field_id')
+        if column != 'field_id':
+            merged[column] = last[column].reindex(merged.index)
+        merged_provided[column] = merged.index.isin(last.index)
+    ordered = [c for c in kinds if c in merged_provided.columns]
+    merged['_provided'] = [tuple(c for c in ordered if row[c]) for _, row in merged_provided.iterrows()]
+    return merged.reset_index(drop=True), errors
+
+
+def upsert_reports(frame):
+    """COPY checked rows into a staging table and upsert them into validation on field_id.
+
+    Rows are loaded in groups of the same provided columns (_provided), and only those columns
+    are written, so the columns a row does not provide keep their current values. Rows whose
+    field_id is not a known observation are not loaded.
+    Returns (inserted, updated, unknown field_ids).
+
+    """
+    qn = connection.ops.quote_name
+    table = qn(Validation._meta.db_table)
+    observation_table = qn(Validation._meta.get_field('field_id').related_model._meta.db_table)
+    inserted, updated, unknown = 0, 0, []
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        for columns, rows in frame.groupby('_provided', sort=False):
+            columns = list(columns)
+            column_list = ', '.join(qn(c) for c in columns)
+            assignments = ', '.join(f'{qn(c)} = EXCLUDED.{qn(c)}' for c in columns if c != 'field_id')
+            conflict = f'DO UPDATE SET {assignments}' if assignments else 'DO NOTHING'
+            buffer = io.StringIO()
+            rows[columns].to_csv(buffer, index=False, header=False, date_format='%Y-%m-%d %H:%M:%S.%f')
+            buffer.seek(0)
+
+            cursor.execute(f'CREATE TEMPORARY TABLE validation_staging ON COMMIT DROP AS '
+                           f'SELECT {column_list} FROM {table} WITH NO DATA')
+            cursor.copy_expert(f'COPY validation_staging ({column_list}) FROM STDIN WITH (FORMAT csv)', buffer)
+            cursor.execute(f'DELETE FROM validation_staging s WHERE NOT EXISTS '
+                           f'(SELECT 1 FROM {observation_table} o WHERE o.name = s.field_id) RETURNING field_id')
+            unknown.extend(row[0] for row in cursor.fetchall())
+            cursor.execute(f'INSERT INTO {table} ({column_list}) SELECT {column_list} FROM validation_staging '
+                           f'ON CONFLICT (field_id) {conflict} RETURNING (xmax = 0)')
+            results = [row[0] for row in cursor.fetchall()]
+            cursor.execute('DROP TABLE validation_staging')
+            inserted += sum(results)
+            updated += len(results) - sum(results)
+    return inserted, updated, sorted(unknown)
@@ -2,10 +2,135 @@ from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import logout
 from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET, require_POST
+import io
+import math
 import urllib.parse
 
+import pandas as pd
+
+from .decorators import api_auth_required
+from .streaming import streaming_response
+from .spatial import TABLES, cone_search, box_search
+from .export import EXPORTS, FORMATS, export_stream
+from .validation_reports import column_kinds, read_report, check_reports, upsert_reports
+
 
 def logout_view(request):
   logout(request)
   url = settings.LOGOUT_URL + '?redirect_uri=' + urllib.parse.quote(f"https://{request.get_host()}/admin")
-  return redirect(url)
\ No newline at end of file
+  return redirect(url)
+
+
+def _float_params(request, names):
+  return [float(request.GET[name]) for name in names]
+
+
+@require_GET
+@api_auth_required
+def cone_search_view(request, table):
+  """Tiles or observations within a radius of a position, e.g. GET /api/search/tile/cone/?ra=345.9&dec=8.4&radius=2
+
+  All values in degrees. Results are ordered by distance.
+  """
+  if table not in TABLES:
+    return JsonResponse({'error': f'Unknown table {table}'}, status=404)
+  try:
+    ra, dec, radius = _float_params(request, ('ra', 'dec', 'radius'))
+    limit = int(request.GET.get('limit', 1000))
+  except (KeyError, ValueError):
+    return JsonResponse({'error': 'ra, dec and radius (degrees) are required'}, status=400)
+  if not all(math.isfinite(v) for v in (ra, dec, radius)):
+    return JsonResponse({'error': 'ra, dec and radius must be finite'}, status=400)
+  if not -90 <= dec <= 90 or not 0 < radius <= settings.SPATIAL_SEARCH_MAX_RADIUS:
+    return JsonResponse({'error': f'dec must be in [-90, 90] and radius in (0, {settings.SPATIAL_SEARCH_MAX_RADIUS}]'}, status=400)
+
+  results = cone_search(table, ra % 360, dec, radius, min(max(limit, 1), settings.SPATIAL_SEARCH_MAX_LIMIT))
+  return JsonResponse({'results': results})
+
+
+@require_GET
+@api_auth_required
+def box_search_view(request, table):
+  """Tiles or observations in a box, e.g. GET /api/search/tile/box/?ra_min=340&ra_max=350&dec_min=0&dec_max=10
+
+  All values in degrees. The box wraps through RA 0 when ra_min > ra_max, and covers all RA when
+  ra_max - ra_min >= 360 (e.g. ra_min=0&ra_max=360).
+  """
+  if table not in TABLES:
+    return JsonResponse({'error': f'Unknown table {table}'}, status=404)
+  try:
+    ra_min, ra_max, dec_min, dec_max = _float_params(request, ('ra_min', 'ra_max', 'dec_min', 'dec_max'))
+    limit = int(request.GET.get('limit', 1000))
+  except (KeyError, ValueError):
+    return JsonResponse({'error': 'ra_min, ra_max, dec_min and dec_max (degrees) are required'}, status=400)
+  if not all(math.isfinite(v) for v in (ra_min, ra_max, dec_min, dec_max)):
+    return JsonResponse({'error': 'ra_min, ra_max, dec_min and dec_max must be finite'}, status=400)
+  if not -90 <= dec_min <= dec_max <= 90:
+    return JsonResponse({'error': 'Require -90 <= dec_min <= dec_max <= 90'}, status=400)
+
+  if ra_max - ra_min >= 360:
+    ra_min, ra_max = 0, 360
+  else:
+    ra_min, ra_max = ra_min % 360, ra_max % 360
+  results = box_search(table, ra_min, ra_max, dec_min, dec_max,
+                       min(max(limit, 1), settings.SPATIAL_SEARCH_MAX_LIMIT))
+  return JsonResponse({'results': results})
+
+
+CONTENT_TYPES = {
+  'csv': 'text/csv',
+  'parquet': 'application/vnd.apache.parquet',
+}
+
+
+@require_GET
+@api_auth_required
+def export_view(request, name, fmt):
+  """Stream a whole table, e.g. GET /api/export/validation.csv or GET /api/export/tile_map.parquet
+
+  Rows are read with a server-side cursor, so memory use does not grow with the table size.
+  Parquet output requires pyarrow.
+  """
+  if name not in EXPORTS:
+    return JsonResponse({'error': f'Unknown table {name}'}, status=404)
+  if fmt not in FORMATS:
+    return JsonResponse({'error': f'Format must be one of {", ".join(FORMATS)}'}, status=400)
+  if fmt == 'parquet':
+    try:
+      import pyarrow  # noqa: F401
+    except ImportError:
+      return JsonResponse({'error': 'Parquet export is not available (pyarrow is not installed)'}, status=501)
+
+  response = streaming_response(request, export_stream(name, fmt), content_type=CONTENT_TYPES[fmt])
+  response['Content-Disposition'] = f'attachment; filename="{name}.{fmt}"'
+  return response
+
+
+@require_POST
+@api_auth_required(permissions=lambda request: ['survey.add_validation', 'survey.change_validation'])
+def validation_upload(request):
+  """Load validation reports, e.g. POST /api/validation/upload/ with one or more files in the "reports" field
+
+  Each file is a CSV file with a header row of validation column names, or a JSON object (or list
+  of objects) with the same keys. Rows are upserted on field_id; invalid rows are reported and skipped.
+  """
+  files = request.FILES.getlist('reports')
+  if not files:
+    return JsonResponse({'error': 'No files uploaded in the "reports" field'}, status=400)
+  try:
+    frames = [read_report(f.name, io.TextIOWrapper(f.file, encoding='utf-8')) for f in files]
+  except (ValueError, UnicodeDecodeError) as e:
+    return JsonResponse({'error': f'Could not read reports: {e}'}, status=400)
+
+  rows, errors = check_reports(pd.concat(frames, ignore_index=True), column_kinds())
+  inserted, updated, unknown = upsert_reports(rows) if len(rows) else (0, 0, [])
+  errors.extend(f'Unknown observation {field_id}' for field_id in unknown)
+  return JsonResponse({
+    'reports': len(files),
+    'inserted': inserted,
+    'updated': updated,
+    'error_count': len(errors),
+    'errors': errors[:settings.VALIDATION_UPLOAD_MAX_ERRORS],
+  })